@@ -54,8 +54,12 @@ setup(
     ],
     extras_require={
         ':python_version == "2.7"': [
+            'futures==3.2.0',
             'pathlib2==2.3.2',
         ],
+        'avro': [
+            'fastavro',
+        ],
     },
     include_package_data=True,
     scripts=[],
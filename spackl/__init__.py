@@ -1,4 +1,4 @@
-from spackl import db, file
+from spackl import cache, db, file, metrics
 
-__all__ = [db, file]
+__all__ = [cache, db, file, metrics]
 __version__ = '0.1.0'
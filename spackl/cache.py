@@ -0,0 +1,332 @@
+"""
+    An opt-in cache of query results, kept in memory and optionally on disk
+"""
+import hashlib
+import logging
+import os
+import pickle
+import re
+import six
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+
+from spackl.metrics import approximate_bytes
+from spackl.result import STORAGE_ROWS
+from spackl.util import Path
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Quoted strings and identifiers, where whitespace is significant, and the comments outside them
+_TOKENS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|--[^\n]*|/\*.*?\*/""", re.DOTALL)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query_string):
+    """
+        Drop the comments, whitespace and trailing semicolon of a query, so trivially different
+        copies of a query share a cache entry. Quoted strings are left as they are.
+
+        Comments are dropped before whitespace is collapsed, since a newline ends a -- comment.
+
+        Args:
+            query_string : str - The query to normalize
+
+        Returns:
+            str
+    """
+    query_string = str(query_string)
+    parts = list()
+    unquoted = ''
+    position = 0
+    for match in _TOKENS.finditer(query_string):
+        unquoted += query_string[position:match.start()]
+        if match.group(1) is None:
+            unquoted += ' '
+        else:
+            parts.extend([_WHITESPACE.sub(' ', unquoted), match.group(1)])
+            unquoted = ''
+        position = match.end()
+    parts.append(_WHITESPACE.sub(' ', unquoted + query_string[position:]).rstrip().rstrip(';'))
+    return ''.join(parts).strip()
+
+
+def make_key(*parts):
+    """
+        Hash the parts identifying a query into a cache key
+
+        Returns:
+            str
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+class _CacheEntry(object):
+    __slots__ = ['result_class', 'keys', 'storage', 'data', 'size', 'expires']
+
+    def __init__(self, result_class, keys, storage, data, size, expires):
+        self.result_class = result_class
+        self.keys = keys
+        self.storage = storage
+        self.data = data
+        self.size = size
+        self.expires = expires
+
+    @classmethod
+    def from_result(cls, result, expires):
+        copy = result._copy()
+        data = copy._result if copy._columns is None else copy._columns
+        return cls(type(result), list(result._keys), result.storage, data, approximate_bytes(result), expires)
+
+    @property
+    def expired(self):
+        return self.expires is not None and self.expires <= time.time()
+
+    def result(self):
+        # Results can be changed in place (append, pop, etc), so every hit gets its own copy of the row list
+        return self.result_class._from_part(self.keys, list(self.data), self.storage)
+
+
+class ResultCache(object):
+    """
+        A cache of query results, shared by any number of sources
+
+        Entries are kept in memory up to max_bytes, evicting the least recently used first. With a path,
+        entries are also written there and read back when they are no longer in memory, surviving restarts.
+        Sizes are estimated with spackl.metrics.approximate_bytes.
+
+        Usage:
+            cache = ResultCache(max_bytes=256 * 1024 * 1024, ttl=600)
+            pg = Postgres(cache=cache)
+            pg.query('SELECT ...')  # runs the query
+            pg.query('SELECT ...')  # returned from the cache
+
+        Kwargs:
+            max_bytes : int - The approximate most bytes of results to keep in memory
+            ttl : float - The default seconds an entry is kept for, None to keep entries until evicted
+            path : str - A directory to keep entries on disk in
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=None, path=None):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._path = None
+        if path is not None:
+            self._path = Path(path).expanduser()
+            if not self._path.exists():
+                self._path.mkdir(parents=True)
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return '<ResultCache: {} entries, {} bytes>'.format(len(self._entries), self._bytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes(self):
+        """
+            Get the approximate bytes of the results held in memory
+
+            Returns:
+                int
+        """
+        return self._bytes
+
+    def _file(self, key):
+        return self._path / '{}.pickle'.format(key)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._forget(key)
+            if entry.size > self._max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def _forget(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def _read(self, key):
+        """
+            Get an entry from the disk tier, or None if it isn't there or can't be read
+        """
+        path = self._file(key)
+        if not path.exists():
+            return None
+        try:
+            with path.open('rb') as f:
+                return _CacheEntry(*pickle.load(f))
+        except Exception as e:
+            _log.warning('Could not read cache entry %s : %s', path, e)
+            self._remove(path)
+            return None
+
+    def _write(self, key, entry):
+        values = (entry.result_class, entry.keys, entry.storage, entry.data, entry.size, entry.expires)
+        try:
+            # Write to a temp file first, so readers never see a partial entry
+            fd, tmp = tempfile.mkstemp(dir=str(self._path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, str(self._file(key)))
+        except Exception as e:
+            _log.warning('Could not write cache entry %s : %s', key, e)
+
+    def _remove(self, path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def get(self, key):
+        """
+            Get a copy of the result cached under the given key
+
+            Args:
+                key : str - The key the result was put under
+
+            Returns:
+                BaseResult, or None if there is no unexpired entry for the key
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # Re-insert to mark it as the most recently used
+                self._entries[key] = entry
+
+        if entry is None and self._path is not None:
+            entry = self._read(key)
+            if entry is not None and not entry.expired:
+                self._remember(key, entry)
+
+        if entry is not None and entry.expired:
+            self.invalidate(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            return None
+        return entry.result()
+
+    def put(self, key, result, ttl=None):
+        """
+            Cache a result under the given key
+
+            Args:
+                key : str - The key to cache the result under
+                result : BaseResult - The result to cache
+
+            Kwargs:
+                ttl : float - The seconds to keep this entry for, defaults to the cache ttl
+
+            Returns:
+                None
+        """
+        ttl = self._ttl if ttl is None else ttl
+        entry = _CacheEntry.from_result(result, None if ttl is None else time.time() + ttl)
+        self._remember(key, entry)
+        if self._path is not None:
+            self._write(key, entry)
+
+    def invalidate(self, key):
+        """
+            Drop the entry cached under the given key, from memory and disk
+
+            Args:
+                key : str - The key to drop
+
+            Returns:
+                None
+        """
+        self._forget(key)
+        if self._path is not None:
+            self._remove(self._file(key))
+
+    def clear(self):
+        """
+            Drop every entry, from memory and disk
+
+            Returns:
+                None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._path is not None:
+            for path in self._path.glob('*.pickle'):
+                self._remove(path)
+
+
+class Cached(object):
+    """
+        Mixin for sources whose query results can be kept in a ResultCache
+    """
+    _cache = None
+
+    @property
+    def cache(self):
+        """
+            Get the ResultCache query results are kept in, or None if caching is off
+
+            Returns:
+                ResultCache
+        """
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        if value is not None and not isinstance(value, ResultCache):
+            raise TypeError('cache must be a ResultCache, not %s' % type(value))
+        self._cache = value
+
+    def _cache_identity(self):
+        """
+            Get what distinguishes this source's results from another's for the same query
+
+            Returns:
+                tuple, or None if results from this source can't be cached right now
+        """
+        return None
+
+    def _query_key(self, query_string=None, params=None, storage=STORAGE_ROWS):
+        """
+            Get the key identifying a query's result, for caching it or sharing it between callers
+
+            Returns:
+                str, or None if the result can't be reused
+        """
+        identity = self._cache_identity()
+        if identity is None:
+            return None
+        query = normalize_query(query_string) if query_string is not None else None
+        return make_key(identity, query, sorted(six.iteritems(params or dict())), storage)
+
+    def _cache_get(self, key):
+        if key is None or self._cache is None:
+            return None
+        return self._cache.get(key)
+
+    def _cache_put(self, key, result):
+        if key is not None and self._cache is not None:
+            self._cache.put(key, result)
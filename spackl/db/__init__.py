@@ -2,6 +2,6 @@ from .bigquery import BigQuery
 from .postgres import Postgres
 from .redshift import Redshift
 from .config import Config
-from .result import QueryResult
+from .result import LazyQueryResult, QueryResult
 
-__all__ = [BigQuery, Postgres, Redshift, Config, QueryResult]
+__all__ = [BigQuery, Postgres, Redshift, Config, LazyQueryResult, QueryResult]
@@ -0,0 +1,154 @@
+"""
+    Helpers for running queries from an asyncio event loop
+
+    These are written with futures and callbacks instead of async/await, so spackl still imports
+    on python 2. The async methods on each source return asyncio futures, which can be awaited.
+"""
+import functools
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+
+def get_loop(loop=None):
+    """
+        Get the event loop to schedule work on
+
+        Kwargs:
+            loop : asyncio.AbstractEventLoop - Use this loop, instead of the current one
+
+        Returns:
+            asyncio.AbstractEventLoop
+    """
+    if asyncio is None:  # pragma: no cover
+        raise RuntimeError('Async queries need asyncio, available on python 3')
+    if loop is not None:
+        return loop
+    return asyncio.get_event_loop()
+
+
+def run_in_executor(loop, fn, *args, **kwargs):
+    """
+        Run a blocking function in the loop's default executor
+
+        Returns:
+            asyncio.Future - Resolves to the function's return value
+    """
+    return loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+def then(future, callback, result):
+    """
+        Call callback with the value of future once it is done, or pass its exception on to result.
+        An exception raised by the callback is also set on result.
+
+        Args:
+            future : asyncio.Future - The step to wait on
+            callback : callable - Called with the future's value
+            result : asyncio.Future - The future of the whole chain of steps
+
+        Returns:
+            None
+    """
+    def done(future):
+        if result.done():
+            return
+        if future.cancelled():
+            result.cancel()
+            return
+        if future.exception() is not None:
+            result.set_exception(future.exception())
+            return
+        try:
+            callback(future.result())
+        except Exception as e:
+            if not result.done():
+                result.set_exception(e)
+
+    future.add_done_callback(done)
+
+
+def poll_connection(loop, conn, on_ready, on_error):
+    """
+        Poll an async psycopg2 connection from the event loop until its pending operation finishes
+
+        Waits for the connection's socket to be readable or writable as the driver asks,
+        so the loop is never blocked on the database.
+
+        Args:
+            loop : asyncio.AbstractEventLoop - The loop to watch the socket from
+            conn : psycopg2 connection - A connection opened with async_=True
+            on_ready : callable - Called with no args once the operation is done
+            on_error : callable - Called with the exception if polling, or on_ready, fails
+
+        Returns:
+            None
+    """
+    from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+    fd = conn.fileno()
+
+    def step():
+        loop.remove_reader(fd)
+        loop.remove_writer(fd)
+        try:
+            state = conn.poll()
+            if state == POLL_OK:
+                on_ready()
+            elif state == POLL_READ:
+                loop.add_reader(fd, step)
+            elif state == POLL_WRITE:
+                loop.add_writer(fd, step)
+            else:
+                raise RuntimeError('Unexpected poll state from the connection : %r' % state)
+        except Exception as e:
+            on_error(e)
+
+    step()
+
+
+class AsyncBatches(object):
+    """
+        Async iterator over the batches of a blocking batch generator
+
+        Each batch is fetched in the loop's default executor, so the loop keeps running while
+        the driver waits on the database.
+
+        Usage:
+            async for batch in pg.iter_batches_async('SELECT ...'):
+                ...
+
+        Args:
+            make_batches : callable - Takes no args and returns an iterator of QueryResults.
+                                      Called in the executor, since starting the query blocks too.
+
+        Kwargs:
+            loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+    """
+    def __init__(self, make_batches, loop=None):
+        self._make_batches = make_batches
+        self._batches = None
+        self._loop = loop
+
+    def __aiter__(self):
+        return self
+
+    def _next(self):
+        if self._batches is None:
+            self._batches = iter(self._make_batches())
+        try:
+            return next(self._batches)
+        except StopIteration:
+            raise StopAsyncIteration  # noqa: F821 - only reached on python 3
+
+    def __anext__(self):
+        return run_in_executor(get_loop(self._loop), self._next)
+
+    def close(self):
+        """
+            Stop the underlying generator, releasing its connection
+        """
+        close = getattr(self._batches, 'close', None)
+        if close is not None:
+            close()
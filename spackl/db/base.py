@@ -1,7 +1,13 @@
 import os
+import threading
 
+from spackl.cache import Cached
+from spackl.metrics import Instrumented
+from spackl.result import DEFAULT_BATCH_SIZE, STORAGE_ROWS
 from spackl.util import ABC, abstractmethod
 
+from . import aio
+
 
 def get_default_db_conn_kwargs():
     """
@@ -17,16 +23,100 @@ def get_default_db_conn_kwargs():
     }
 
 
-class BaseDb(ABC):
+class _Flight(object):
+    __slots__ = ['done', 'result', 'error']
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+        Lets concurrent callers with the same key share one run of a function
+
+        The first caller runs it, the rest wait for its result. Nothing is kept once the run finishes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = dict()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, fn):
+        """
+            Run fn, or wait for the run already in flight for the key
+
+            Args:
+                key : str - Identifies calls that can share a run
+                fn : callable - Takes no args, returns a BaseResult
+
+            Returns:
+                BaseResult - The result of the run, copied for every caller but the one that ran it
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result._copy()
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+_flights = SingleFlight()
+
+
+class BaseDb(Instrumented, Cached, ABC):
+    """
+        Base class for database sources
+
+        Callables registered with add_listener() receive a spackl.metrics.QueryEvent
+        for each query, with its per-phase timings, row count and approximate bytes.
+        Setting cache to a spackl.cache.ResultCache keeps query results for reuse.
+        With coalesce on, concurrent identical queries share one run and its result.
+    """
     _connected = False
     _conn = None
     _db_type = None
     _conn_kwargs = None
+    _coalesce_queries = False
 
     @property
     def connected(self):
         return self._connected
 
+    def _coalesce(self, key, fn):
+        """
+            Run a query, sharing the run with concurrent calls for the same query when coalescing is on
+
+            Args:
+                key : str - The query key from _query_key, None if the query can't be shared
+                fn : callable - Runs the query and returns its result
+
+            Returns:
+                BaseResult
+        """
+        if key is None or not self._coalesce_queries:
+            return fn()
+        return _flights.do(key, fn)
+
     @abstractmethod
     def _connect(self):
         """
@@ -73,6 +163,8 @@ class BaseDb(ABC):
                 query_string : str - The query to run against the database
 
             Kwargs:
+                storage : str - How the QueryResult holds its data, 'rows', 'tuples' or 'columns'
+                lazy : bool - Return a LazyQueryResult that fetches rows only as they are needed
                 kwargs : Arbitrary parameters to pass to the query engine
 
             Returns:
@@ -97,3 +189,63 @@ class BaseDb(ABC):
                 None
         """
         raise NotImplementedError()
+
+    def query_async(self, query_string, loop=None, **kwargs):
+        """
+            Run a query from an asyncio event loop, without blocking it
+
+            Runs query() in the loop's default executor. Sources with a non-blocking driver override this.
+
+            Args:
+                query_string : str - The query to run against the database
+
+            Kwargs:
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                kwargs : The same kwargs as query()
+
+            Returns:
+                asyncio.Future - Resolves to the QueryResult, can be awaited
+        """
+        return aio.run_in_executor(aio.get_loop(loop), self.query, query_string, **kwargs)
+
+    def execute_async(self, query_string, loop=None, **kwargs):
+        """
+            Run a statement from an asyncio event loop, without blocking it
+
+            Runs execute() in the loop's default executor. Sources with a non-blocking driver override this.
+
+            Args:
+                query_string : str - The statement to run against the database
+
+            Kwargs:
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                kwargs : The same kwargs as execute()
+
+            Returns:
+                asyncio.Future - Resolves to None once the statement is done, can be awaited
+        """
+        return aio.run_in_executor(aio.get_loop(loop), self.execute, query_string, **kwargs)
+
+    def _iter_batches(self, query_string, batch_size, storage):
+        return self.query(query_string, storage=storage, lazy=True).iter_batches(batch_size)
+
+    def iter_batches_async(self, query_string, batch_size=DEFAULT_BATCH_SIZE, storage=STORAGE_ROWS, loop=None):
+        """
+            Stream a query's rows in batches with async for, from an asyncio event loop
+
+            Usage:
+                async for batch in db.iter_batches_async('SELECT ...'):
+                    ...
+
+            Args:
+                query_string : str - The query to run against the database
+
+            Kwargs:
+                batch_size : int - The most rows to put in each batch
+                storage : str - How each batch holds its data, 'rows', 'tuples' or 'columns'
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+
+            Returns:
+                AsyncBatches - An async iterator of QueryResult
+        """
+        return aio.AsyncBatches(lambda: self._iter_batches(query_string, batch_size, storage), loop=loop)
@@ -1,19 +1,51 @@
 """
     Class for using Google BigQuery as a source database
 """
+import base64
+import datetime
+import decimal
+import google.auth
+import json
 import logging
 import os
 import six
+import tempfile
+import threading
+import time
 
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from google.cloud.bigquery import Client
 
-from spackl.util import Path
+from spackl.metrics import NO_TIMING
+from spackl.result import DEFAULT_BATCH_SIZE, STORAGE_ROWS, STORAGE_TUPLES
+from spackl.util import DtDecEncoder, Path
 
+from . import aio
 from .base import BaseDb
 
+try:
+    import fastavro
+except ImportError:
+    fastavro = None
+
 _log = logging.getLogger(__name__)
 
 
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_POLL_INTERVAL = 10.0
+
+LOAD_FORMATS = ('json', 'avro')
+# Rows are serialized in memory up to SPOOL_BYTES, then to a temp file on disk
+SPOOL_BYTES = 64 * 1024 * 1024
+DEFAULT_CHUNK_BYTES = 1024 * 1024 * 1024
+
+DEFAULT_METADATA_TTL = 60
+TABLE_METADATA_KEYS = ['table_id', 'table_type', 'num_rows', 'num_bytes', 'created', 'modified', 'expires']
+DEFAULT_READERS = 8
+DEFAULT_PAGE_SIZE = 10000
+
 BIGQUERY_DEFAULT_CONN_KWARGS = {
     'project': None,
     'credentials': None,
@@ -21,18 +53,185 @@ BIGQUERY_DEFAULT_CONN_KWARGS = {
 }
 
 
+class _LoadEncoder(DtDecEncoder):
+    """
+        Encodes values as BigQuery parses them from JSON, keeping the precision of decimals
+    """
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        if isinstance(obj, datetime.time):
+            return obj.isoformat()
+        if isinstance(obj, (bytes, bytearray)):
+            return base64.b64encode(obj).decode('ascii')
+        return super(_LoadEncoder, self).default(obj)
+
+
+def _avro_type(value):
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, six.integer_types):
+        return 'long'
+    if isinstance(value, (float, decimal.Decimal)):
+        return 'double'
+    if isinstance(value, datetime.datetime):
+        return {'type': 'long', 'logicalType': 'timestamp-micros'}
+    if isinstance(value, datetime.date):
+        return {'type': 'int', 'logicalType': 'date'}
+    if isinstance(value, (bytes, bytearray)):
+        return 'bytes'
+    return 'string'
+
+
+def _avro_schema(columns, batch):
+    """
+        Infer a schema of nullable fields from the first value that isn't None in each column,
+        treating columns without one as strings
+    """
+    fields = list()
+    rows = batch.list()
+    for i, column in enumerate(columns):
+        value = next((row[i] for row in rows if row[i] is not None), None)
+        fields.append({'name': column, 'type': ['null', _avro_type(value)], 'default': None})
+    return fastavro.parse_schema({'type': 'record', 'name': 'Row', 'fields': fields})
+
+
+class _ChunkReader(object):
+    """
+        A read-only view of a chunk's temp file. The client only uploads files opened in 'rb' mode,
+        and a SpooledTemporaryFile is always 'w+b'.
+    """
+    mode = 'rb'
+
+    def __init__(self, file):
+        self._file = file
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+
+class _LoadChunk(object):
+    """
+        One load job's worth of serialized rows, in a temp file kept in memory until it gets big
+    """
+    def __init__(self, format, columns):
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self.rows = 0
+        self._format = format
+        self._columns = columns
+        self._writer = None
+
+    @property
+    def size(self):
+        return self.file.tell()
+
+    def write(self, batch):
+        if self._format == 'json':
+            for row in batch.list():
+                line = json.dumps(dict(zip(self._columns, row)), cls=_LoadEncoder, separators=(',', ':'))
+                self.file.write(line.encode('utf-8') + b'\n')
+        else:
+            if self._writer is None:
+                self._writer = fastavro.write.Writer(self.file, _avro_schema(self._columns, batch))
+            for row in batch.list():
+                self._writer.write(dict(zip(self._columns, row)))
+            # Write out the block, so the size of the file is up to date
+            self._writer.flush()
+        self.rows += len(batch)
+
+    def reader(self):
+        """
+            Get the serialized rows as a binary stream to upload, from the start
+        """
+        self.file.seek(0)
+        return _ChunkReader(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+# Clients shared by every BigQuery instance, keyed on (project, location, creds_file, credentials)
+_clients = dict()
+_clients_lock = threading.Lock()
+
+
+def _load_credentials(creds_file):
+    """
+        Load credentials from a file, returning (None, None) to fall back to the default credentials
+    """
+    if not creds_file:
+        return None, None
+    if not Path(creds_file).exists():
+        _log.warning('Path set by creds file does not exist: %s', creds_file)
+        return None, None
+    return google.auth.load_credentials_from_file(creds_file)
+
+
+def get_client(project=None, location=None, creds_file=None, credentials=None):
+    """
+        Get the BigQuery client shared by every source with the same project, location and credentials,
+        building it the first time
+
+        Sharing a client shares its credentials and HTTP session, so building more sources is cheap.
+        Credentials are loaded from creds_file and passed to the client, instead of through
+        GOOGLE_APPLICATION_CREDENTIALS, so sources with different files don't affect each other.
+
+        Kwargs:
+            project : str - The project to run jobs in, defaults to the project of the credentials
+            location : str - The location to run jobs in
+            creds_file : str - The filepath of a credentials file, e.g. a service account key
+            credentials : google.auth.credentials.Credentials - Credentials to use instead of creds_file
+
+        Returns:
+            google.cloud.bigquery.Client
+    """
+    key = (project, location, creds_file or None, credentials)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if credentials is None:
+                credentials, creds_project = _load_credentials(creds_file)
+                project = project or creds_project
+            client = _clients[key] = Client(project=project, credentials=credentials, location=location)
+        return client
+
+
+def clear_clients():
+    """
+        Drop every shared client, so the next sources build new ones
+
+        Returns:
+            None
+    """
+    with _clients_lock:
+        _clients.clear()
+
+
 class BigQuery(BaseDb):
     """
         A Google BigQuery database client
 
         Kwargs:
             name : str - The canonical name to use for this instance
-            creds_file : str - The filepath of the desired GOOGLE_APPLICATION_CREDENTIALS file
+            creds_file : str - The filepath of the credentials to use, e.g. a service account key.
+                               Defaults to the BIGQUERY_CREDS_FILE environment variable.
+            cache : ResultCache - Keep the results of non-lazy queries here,
+                                  returning them again for the same query
+            coalesce : bool - Let concurrent identical non-lazy queries share one run
+            metadata_ttl : float - Seconds to keep the tables described in each dataset, 0 to always
+                                   ask the API. Forgotten after execute(), load() and table changes.
             conn_kwargs : Use in place of a query string to set individual
                           attributes of the connection defaults (project, etc)
     """
 
-    def __init__(self, name=None, creds_file=None, **conn_kwargs):
+    def __init__(self, name=None, creds_file=None, cache=None, coalesce=False, metadata_ttl=DEFAULT_METADATA_TTL,
+                 **conn_kwargs):
         if creds_file is None:
             creds_file = os.getenv('BIGQUERY_CREDS_FILE', None)
         self._bq_creds_file = creds_file
@@ -40,6 +239,11 @@ class BigQuery(BaseDb):
         self._conn_kwargs = dict(**BIGQUERY_DEFAULT_CONN_KWARGS)
 
         self._name = name
+        self.cache = cache
+        self._coalesce_queries = coalesce
+        self._metadata_ttl = metadata_ttl
+        self._metadata = dict()
+        self._metadata_lock = threading.Lock()
         for k, v in six.iteritems(conn_kwargs):
             if k in self._conn_kwargs:
                 self._conn_kwargs[k] = v
@@ -60,32 +264,431 @@ class BigQuery(BaseDb):
         self._conn_kwargs['project'] = value
 
     def _connect(self):
-        if self._bq_creds_file is not None:
-            if Path(self._bq_creds_file).exists():
-                os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', self._bq_creds_file)
-            else:
-                _log.warning('Path set by creds file does not exist: %s', self._bq_creds_file)
-        self._conn = Client(**self._conn_kwargs)
+        self._conn = get_client(creds_file=self._bq_creds_file, **self._conn_kwargs)
 
     def _close(self):
         """
-            This is a no-op because the bigquery Client doesn't have a close method.
+            This is a no-op because the bigquery Client is shared with other instances.
             The BaseDb close method will handle setting self._conn to None and self._connected to False.
         """
         return
 
-    def _query(self, query_string):
+    def _cache_identity(self):
+        return (self.__class__.__name__, self._bq_creds_file,
+                self._conn_kwargs['project'], self._conn_kwargs['location'])
+
+    def _query(self, query_string, timing=NO_TIMING):
+        with timing.phase('connect'):
+            self.connect()
+        with timing.phase('execute'):
+            query_job = self._conn.query(query_string)
+            return query_job.result()
+
+    def _query_all(self, query_string, storage, key=None, lazy=False):
+        from .result import LazyQueryResult, QueryResult
+        with self._instrument('query', query_string) as timing:
+            result = self._query(query_string, timing)
+            with timing.phase('fetch'):
+                if lazy:
+                    result = LazyQueryResult(result, storage=storage)
+                else:
+                    result = QueryResult(result, storage=storage)
+            timing.count(result)
+        self._cache_put(key, result)
+        return result
+
+    def query(self, query_string, storage=STORAGE_ROWS, lazy=False):
+        if lazy:
+            return self._query_all(query_string, storage, lazy=True)
+
+        key = self._query_key(query_string, storage=storage)
+        result = self._cache_get(key)
+        if result is None:
+            result = self._coalesce(key, lambda: self._query_all(query_string, storage, key))
+        return result
+
+    def execute(self, query_string):
+        with self._instrument('execute', query_string) as timing:
+            try:
+                self._query(query_string, timing)
+            finally:
+                # The statement may have created, changed or dropped tables in any dataset
+                self._forget_metadata()
+
+    def query_parallel(self, query_string, readers=DEFAULT_READERS, page_size=DEFAULT_PAGE_SIZE,
+                       max_results=None, selected_fields=None, sink=None, storage=STORAGE_ROWS):
+        """
+            Run a query and read its result with several concurrent readers, one page of rows each
+
+            Once the job is done, its destination table is split into pages of page_size rows, each
+            read by its own list_rows call at its own offset, with up to readers pages in flight at a
+            time. The pages are put back together in order. Results aren't cached or coalesced.
+
+            Args:
+                query_string : str - The query to run
+
+            Kwargs:
+                readers : int - The most pages to read at once
+                page_size : int - The number of rows per page
+                max_results : int - The most rows to read
+                selected_fields : list of str - Read only these columns of the result
+                sink : callable - Called with each page (a QueryResult) in order, one call at a time,
+                                  instead of collecting the rows into one result
+                storage : str - How the result, or each page sent to the sink, holds its data
+
+            Returns:
+                QueryResult with every row in order,
+                or when given a sink, dict - {'rows': rows read, 'pages': pages read}
+        """
+        from .result import QueryResult
+        with self._instrument('query_parallel', query_string) as timing:
+            with timing.phase('connect'):
+                self.connect()
+            with timing.phase('execute'):
+                job = self._conn.query(query_string)
+                job.result()
+                # Older clients leave the iterator's total_rows unset until a page is read
+                table = self._conn.get_table(job.destination)
+                total = table.num_rows or 0
+
+            fields = table.schema
+            if selected_fields is not None:
+                by_name = dict((f.name, f) for f in fields)
+                missing = [name for name in selected_fields if name not in by_name]
+                if missing:
+                    raise ValueError('selected_fields not in the result : %s' % missing)
+                fields = [by_name[name] for name in selected_fields]
+            keys = [f.name for f in fields]
+            if max_results is not None:
+                total = min(total, max_results)
+
+            def read(start):
+                rows = self._conn.list_rows(table, selected_fields=fields, start_index=start,
+                                            max_results=min(page_size, total - start), page_size=page_size)
+                return QueryResult(rows, storage=storage if sink else STORAGE_TUPLES)
+
+            values = list()
+            pages = 0
+            starts = iter(range(0, total, page_size))
+            executor = ThreadPoolExecutor(max_workers=readers)
+            pending = deque()
+            try:
+                with timing.phase('fetch'):
+                    # Keep readers pages in flight, taking them back in order
+                    pending.extend(executor.submit(read, start) for start in islice(starts, readers))
+                    while pending:
+                        page = pending.popleft().result()
+                        start = next(starts, None)
+                        if start is not None:
+                            pending.append(executor.submit(read, start))
+                        pages += 1
+                        if sink is None:
+                            values.extend(page.list())
+                        else:
+                            sink(page)
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=True)
+
+            _log.info('Read %s rows of %s in %s pages', total, job.destination, pages)
+            if sink is not None:
+                return {'rows': total, 'pages': pages}
+            result = QueryResult._from_values(keys, values, storage)
+            timing.count(result)
+            return result
+
+    def query_jobs(self, queries, ordered=False, return_exceptions=False, max_workers=DEFAULT_READERS,
+                   poll_interval=DEFAULT_POLL_INTERVAL, max_poll_interval=DEFAULT_MAX_POLL_INTERVAL,
+                   storage=STORAGE_ROWS):
+        """
+            Submit many queries as jobs up front, and yield their results as the jobs finish
+
+            Every unfinished job is checked on each poll, several at a time. The wait between polls
+            doubles while no job finishes, up to max_poll_interval, and goes back to poll_interval
+            once one does. Jobs still running when the generator is closed are cancelled.
+            Results aren't cached or coalesced.
+
+            Usage:
+                for name, result in bq.query_jobs({'daily': 'SELECT ...', 'weekly': 'SELECT ...'}):
+                    ...
+
+            Args:
+                queries : list or dict - The queries to run, keyed by their index in a list
+                                         or their key in a dict
+
+            Kwargs:
+                ordered : bool - Yield the results in the order of queries, instead of as they finish
+                return_exceptions : bool - Yield the exception of a failed job as its result,
+                                           instead of raising it and cancelling the other jobs
+                max_workers : int - The most API requests to make at once
+                poll_interval : float - Seconds to wait between the first polls
+                max_poll_interval : float - The most seconds to wait between polls
+                storage : str - How each QueryResult holds its data, 'rows', 'tuples' or 'columns'
+
+            Returns:
+                generator of tuples - (key, QueryResult)
+        """
+        from .result import QueryResult
+        if isinstance(queries, dict):
+            items = list(six.iteritems(queries))
+        else:
+            items = list(enumerate(queries))
+        query_strings = dict(items)
         self.connect()
-        query_job = self._conn.query(query_string)
-        return query_job.result()
 
-    def query(self, query_string):
+        def fetch(job, query_string):
+            try:
+                with self._instrument('query_jobs', query_string) as timing:
+                    with timing.phase('fetch'):
+                        result = QueryResult(job.result(), storage=storage)
+                    timing.count(result)
+                return result
+            except Exception as e:
+                return e
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = OrderedDict()
+        try:
+            jobs = executor.map(lambda item: self._conn.query(item[1]), items)
+            pending.update((key, job) for (key, _), job in zip(items, jobs))
+            queued = [key for key, _ in items]
+            finished = dict()
+            interval = poll_interval
+            while pending:
+                states = list(executor.map(lambda job: job.done(), pending.values()))
+                done = [key for key, state in zip(list(pending), states) if state]
+                outcomes = executor.map(lambda key: fetch(pending[key], query_strings[key]), done)
+                for key, outcome in zip(done, outcomes):
+                    del pending[key]
+                    finished[key] = outcome
+
+                while finished:
+                    key = queued[0] if ordered else next(k for k in queued if k in finished)
+                    if key not in finished:
+                        break
+                    queued.remove(key)
+                    outcome = finished.pop(key)
+                    if isinstance(outcome, Exception) and not return_exceptions:
+                        raise outcome
+                    yield key, outcome
+
+                if done:
+                    interval = poll_interval
+                elif pending:
+                    time.sleep(interval)
+                    interval = min(interval * 2, max_poll_interval)
+        finally:
+            for key, job in six.iteritems(pending):
+                _log.info('Cancelling query job %s', key)
+                executor.submit(job.cancel)
+            executor.shutdown(wait=True)
+
+    def _run_job_async(self, query_string, on_done, loop=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+            Start a query job and poll it from the event loop until it finishes
+
+            Every request to the API runs in the loop's default executor, and the loop is free between polls.
+
+            Args:
+                query_string : str - The query to run
+                on_done : callable - Called with the finished job in the executor, e.g. to fetch its rows
+
+            Kwargs:
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                poll_interval : float - Seconds to wait between checks of the job
+
+            Returns:
+                asyncio.Future - Resolves to the return value of on_done
+        """
+        loop = aio.get_loop(loop)
+        result = loop.create_future()
+        jobs = list()
+
+        def submit():
+            self.connect()
+            return self._conn.query(query_string)
+
+        def poll(job):
+            if result.done():
+                return
+            aio.then(aio.run_in_executor(loop, job.done), lambda done: polled(job, done), result)
+
+        def polled(job, done):
+            if done:
+                aio.then(aio.run_in_executor(loop, on_done, job), result.set_result, result)
+            else:
+                loop.call_later(poll_interval, poll, job)
+
+        def started(job):
+            jobs.append(job)
+            poll(job)
+
+        def finish(result):
+            if result.cancelled() and jobs:
+                aio.run_in_executor(loop, jobs[0].cancel)
+
+        result.add_done_callback(finish)
+        aio.then(aio.run_in_executor(loop, submit), started, result)
+        return result
+
+    def query_async(self, query_string, storage=STORAGE_ROWS, loop=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+            Run a query from an asyncio event loop, polling the job without blocking the loop
+
+            Cancelling the future cancels the job. Results aren't cached or coalesced.
+
+            Args:
+                query_string : str - The query to run
+
+            Kwargs:
+                storage : str - How the QueryResult holds its data, 'rows', 'tuples' or 'columns'
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                poll_interval : float - Seconds to wait between checks of the job
+
+            Returns:
+                asyncio.Future - Resolves to the QueryResult, can be awaited
+        """
         from .result import QueryResult
-        result = self._query(query_string)
-        return QueryResult(result)
+        return self._run_job_async(
+            query_string, lambda job: QueryResult(job.result(), storage=storage),
+            loop=loop, poll_interval=poll_interval)
 
-    def execute(self, query_string):
-        self._query(query_string)
+    def execute_async(self, query_string, loop=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+            Run a statement from an asyncio event loop, polling the job without blocking the loop
+
+            Args:
+                query_string : str - The statement to run
+
+            Kwargs:
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                poll_interval : float - Seconds to wait between checks of the job
+
+            Returns:
+                asyncio.Future - Resolves to None once the job is done, can be awaited
+        """
+        def wait(job):
+            try:
+                job.result()
+            finally:
+                self._forget_metadata()
+
+        return self._run_job_async(query_string, wait, loop=loop, poll_interval=poll_interval)
+
+    def load(self, dataset_id, table_id, result, columns=None, format='json', schema=None,
+             write_disposition='WRITE_APPEND', chunk_bytes=DEFAULT_CHUNK_BYTES, batch_size=DEFAULT_BATCH_SIZE):
+        """
+            Bulk load a result into a table with load jobs, instead of DML inserts
+
+            The rows are serialized to newline-delimited JSON or Avro in a temp file, kept in memory
+            until it gets big, and uploaded with one load job. A result serializing to more than
+            chunk_bytes is split across several jobs, one after another, each appending to the last.
+            Nothing is loaded for a result without rows.
+
+            Args:
+                dataset_id : str - The dataset containing the table
+                table_id : str - The table to load into, created if it doesn't exist
+                result : BaseResult - The rows to load, e.g. a QueryResult or the FileResult of CSV.query().
+                                      A LazyQueryResult is streamed through without being held in memory.
+
+            Kwargs:
+                columns : list - The table columns to load the result keys into, in the same order.
+                                 Defaults to the result keys.
+                format : str - 'json', or 'avro' to keep the types of the values. Avro needs fastavro,
+                               and a google-cloud-bigquery recent enough to load Avro logical types.
+                schema : list of google.cloud.bigquery.SchemaField - The schema of the table.
+                         Without it, JSON loads detect the schema and Avro loads use the types of the values.
+                write_disposition : str - 'WRITE_APPEND', 'WRITE_TRUNCATE' or 'WRITE_EMPTY', for the first job
+                chunk_bytes : int - The approximate most bytes to upload per load job
+                batch_size : int - The number of rows to serialize at a time
+
+            Returns:
+                dict - {'rows': rows loaded, 'bytes': bytes uploaded, 'jobs': load jobs run}
+        """
+        from google.cloud.bigquery import LoadJobConfig, SourceFormat
+        if format not in LOAD_FORMATS:
+            raise ValueError('format must be one of %s, not %r' % (LOAD_FORMATS, format))
+        if format == 'avro' and fastavro is None:
+            raise ImportError('Loading Avro needs fastavro, install it with pip install fastavro')
+        if format == 'avro' and not hasattr(LoadJobConfig, 'use_avro_logical_types'):
+            # Older clients would load timestamps and dates as INTEGER without saying so
+            raise RuntimeError('Loading Avro needs a google-cloud-bigquery with LoadJobConfig.use_avro_logical_types')
+        columns = list(columns or result.keys())
+        if not columns:
+            raise ValueError('Cannot load a result without keys')
+        if len(columns) != len(result._keys):
+            raise ValueError('columns must name one table column for each result key')
+
+        self.connect()
+        destination = self._conn.dataset(dataset_id).table(table_id)
+        stats = {'rows': 0, 'bytes': 0, 'jobs': 0}
+
+        def send(chunk):
+            config = LoadJobConfig()
+            # Only the first job can truncate or require an empty table, the rest add to it
+            config.write_disposition = write_disposition if not stats['jobs'] else 'WRITE_APPEND'
+            if format == 'json':
+                config.source_format = SourceFormat.NEWLINE_DELIMITED_JSON
+                config.autodetect = schema is None
+            else:
+                config.source_format = SourceFormat.AVRO
+                config.use_avro_logical_types = True
+            if schema is not None:
+                config.schema = schema
+
+            size = chunk.size
+            job = self._conn.load_table_from_file(chunk.reader(), destination, size=size, job_config=config)
+            job.result()
+            _log.debug('Load job %s loaded %s rows (%s bytes) into %s.%s',
+                       getattr(job, 'job_id', None), chunk.rows, size, dataset_id, table_id)
+            stats['rows'] += chunk.rows
+            stats['bytes'] += size
+            stats['jobs'] += 1
+
+        chunk = _LoadChunk(format, columns)
+        try:
+            for batch in result.iter_batches(batch_size):
+                chunk.write(batch)
+                if chunk.size >= chunk_bytes:
+                    send(chunk)
+                    chunk.close()
+                    chunk = _LoadChunk(format, columns)
+            if chunk.rows:
+                send(chunk)
+        finally:
+            chunk.close()
+            self._forget_metadata(dataset_id)
+
+        _log.info('Loaded %s rows (%s bytes) into %s.%s in %s jobs',
+                  stats['rows'], stats['bytes'], dataset_id, table_id, stats['jobs'])
+        return stats
+
+    def _cached_metadata(self, key, fetch):
+        """
+            Get metadata from the cache if it hasn't expired, or fetch and cache it
+
+            Args:
+                key : tuple - What the metadata is, e.g. ('tables', dataset_id)
+                fetch : callable - Takes no args and returns the metadata
+        """
+        with self._metadata_lock:
+            expires, value = self._metadata.get(key, (0, None))
+        if expires > time.time():
+            return value
+        value = fetch()
+        if self._metadata_ttl:
+            with self._metadata_lock:
+                self._metadata[key] = (time.time() + self._metadata_ttl, value)
+        return value
+
+    def _forget_metadata(self, dataset_id=None):
+        """
+            Drop the cached metadata of a dataset, or of every dataset
+        """
+        with self._metadata_lock:
+            for key in [k for k in self._metadata if dataset_id is None or k[1] == dataset_id]:
+                del self._metadata[key]
 
     def list_tables(self, dataset_id):
         """
@@ -101,6 +704,137 @@ class BigQuery(BaseDb):
         dataset_ref = self._conn.dataset(dataset_id)
         return [t.table_id for t in self._conn.list_tables(dataset_ref)]
 
+    def describe_tables(self, dataset_id, table_ids=None, max_workers=DEFAULT_READERS):
+        """
+            Get the metadata of many tables in a dataset, several at a time
+
+            Tables deleted while they are being described are left out.
+
+            Args:
+                dataset_id : str - The dataset containing the tables
+
+            Kwargs:
+                table_ids : list - The tables to describe, defaults to every table in the dataset
+                max_workers : int - The most API requests to make at once
+
+            Returns:
+                QueryResult - One row per table, with the keys table_id, table_type, num_rows,
+                              num_bytes, created, modified and expires
+        """
+        from google.api_core.exceptions import NotFound
+        from .result import QueryResult
+        if table_ids is None:
+            table_ids = self.list_tables(dataset_id)
+        self.connect()
+
+        def describe(table_id):
+            try:
+                table = self._conn.get_table(self._conn.dataset(dataset_id).table(table_id))
+            except NotFound:
+                return None
+            return tuple(getattr(table, key) for key in TABLE_METADATA_KEYS)
+
+        def fetch():
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                return [row for row in executor.map(describe, table_ids) if row is not None]
+            finally:
+                executor.shutdown(wait=True)
+
+        rows = self._cached_metadata(('describe', dataset_id, tuple(table_ids)), fetch)
+        return QueryResult._from_values(TABLE_METADATA_KEYS, rows)
+
+    def _each_table(self, dataset_id, table_ids, action, max_workers):
+        """
+            Run an action on many tables at once, collecting the errors instead of stopping at the first
+
+            Args:
+                dataset_id : str - The dataset containing the tables
+                table_ids : list - The tables to act on
+                action : callable - Called with each table reference
+                max_workers : int - The most API requests to make at once
+
+            Returns:
+                dict - The exception raised for each table that failed, keyed by table_id
+        """
+        self.connect()
+        errors = dict()
+
+        def run(table_id):
+            try:
+                action(self._conn.dataset(dataset_id).table(table_id))
+            except Exception as e:
+                errors[table_id] = e
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            list(executor.map(run, table_ids))
+        finally:
+            executor.shutdown(wait=True)
+            self._forget_metadata(dataset_id)
+
+        for table_id, error in six.iteritems(errors):
+            _log.warning('Could not update table %s.%s : %r', dataset_id, table_id, error)
+        return errors
+
+    def delete_tables(self, dataset_id, table_ids, not_found_ok=False, max_workers=DEFAULT_READERS):
+        """
+            Delete many tables in a dataset, several at a time
+
+            A failure doesn't stop the other deletes, the errors are returned together.
+
+            Args:
+                dataset_id : str - The dataset containing the tables
+                table_ids : list - The tables to delete
+
+            Kwargs:
+                not_found_ok : bool - Skip tables that don't exist, instead of reporting them as errors
+                max_workers : int - The most API requests to make at once
+
+            Returns:
+                dict - The exception raised for each table that couldn't be deleted, empty if all were
+        """
+        from google.api_core.exceptions import NotFound
+
+        def delete(ref):
+            # Older clients don't take not_found_ok, so skip missing tables here
+            try:
+                self._conn.delete_table(ref)
+            except NotFound:
+                if not not_found_ok:
+                    raise
+
+        return self._each_table(dataset_id, table_ids, delete, max_workers)
+
+    def expire_tables(self, dataset_id, table_ids, expires, max_workers=DEFAULT_READERS):
+        """
+            Set when many tables in a dataset expire, several at a time
+
+            A failure doesn't stop the other updates, the errors are returned together.
+
+            Args:
+                dataset_id : str - The dataset containing the tables
+                table_ids : list - The tables to expire
+                expires : datetime.datetime or datetime.timedelta - When the tables expire, as a UTC time
+                                                                    or a time from now. None to never expire.
+
+            Kwargs:
+                max_workers : int - The most API requests to make at once
+
+            Returns:
+                dict - The exception raised for each table that couldn't be updated, empty if all were
+        """
+        from google.cloud.bigquery import Table
+        if isinstance(expires, datetime.timedelta):
+            expires = datetime.datetime.utcnow() + expires
+
+        def expire(ref):
+            table = Table(ref)
+            table.expires = expires
+            self._conn.update_table(table, ['expires'])
+
+        return self._each_table(dataset_id, table_ids, expire, max_workers)
+
     def delete_table(self, dataset_id, table_id):
         """
             Delete the given table in the given dataset
@@ -112,6 +846,6 @@ class BigQuery(BaseDb):
             Returns:
                 None
         """
-        self.connect()
-        table_ref = self._conn.dataset(dataset_id).table(table_id)
-        self._conn.delete_table(table_ref)
+        errors = self.delete_tables(dataset_id, [table_id])
+        if errors:
+            raise errors[table_id]
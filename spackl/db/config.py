@@ -4,14 +4,62 @@
 import logging
 import os
 import re
+import six
+import threading
+import time
 import yaml
 
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+
+from spackl.result import STORAGE_ROWS, STORAGE_TUPLES
 from spackl.util import Path
 
+from .bigquery import BigQuery
+from .postgres import Postgres
+from .redshift import Redshift
+from .shards import merge_results, shard_query
+
 _log = logging.getLogger(__name__)
 
 
 DEFAULT_CONFIG_FILE = Path('~/.spackl/config.yaml').expanduser()
+DEFAULT_FAN_OUT_WORKERS = 8
+
+DB_TYPES = {
+    'bigquery': BigQuery,
+    'postgres': Postgres,
+    'postgresql': Postgres,
+    'redshift': Redshift,
+}
+
+
+class FanOutResult(object):
+    """
+        The outcome of running queries against many databases at once, keyed by config name
+
+        Attributes:
+            results : dict - The QueryResult of each query that succeeded
+            errors : dict - The exception raised by each query that failed or timed out
+            timings : dict - The seconds each query ran for, or ran before timing out
+    """
+    def __init__(self):
+        self.results = dict()
+        self.errors = dict()
+        self.timings = dict()
+
+    def __repr__(self):
+        return '<FanOutResult: {} succeeded, {} failed>'.format(len(self.results), len(self.errors))
+
+    @property
+    def ok(self):
+        """
+            Check if every query succeeded
+
+            Returns:
+                bool
+        """
+        return not self.errors
 
 
 class Config(object):
@@ -38,17 +86,40 @@ class Config(object):
         config = db.Config()
         pg = db.Postgres(**dbconfig.default)
 
+        or to build the client directly, and to query many databases at once:
+
+        pg = config.get_db('default')
+        checks = config.fan_out({'default': 'SELECT count(*) FROM users',
+                                 'my_other_db': 'SELECT count(*) FROM users'})
+        recent = config.query_shards(['shard_1', 'shard_2'], 'SELECT * FROM events',
+                                     order_by='created_at', descending=True, limit=100)
+
+        Each database is a Postgres client unless its config sets type: "redshift" or
+        type: "bigquery", or has a project (which only BigQuery uses).
+        A Postgres config can list read replicas, which queries are balanced across:
+
+        - name: "warehouse"
+          host: "primary.example.com"
+          ...
+          balancer: "least_outstanding"
+          replicas:
+            - host: "replica1.example.com"
+            - host: "replica2.example.com"
+
 
         Kwargs:
             config_file : str - The path of the config file to load
 
         TODO(aaronbiller): allow config to create config file and write to it
-        TODO(aaronbiller): allow instantiation of BaseDb right from the config
     """
     _config = None
     _dbs = list()
 
     def __init__(self, config_file=None):
+        self._named = OrderedDict()
+        self._clients = dict()
+        self._clients_lock = threading.Lock()
+
         if config_file is not None:
             _log.debug('Setting config from provided path')
             self._set_config_from_file(config_file)
@@ -117,6 +188,7 @@ class Config(object):
             cleaned_name = self._clean_db_name(db['name'])
 
             setattr(self, cleaned_name, db)
+            self._named[cleaned_name] = db
 
     def _clean_db_name(self, name):
         """
@@ -139,3 +211,131 @@ class Config(object):
                 cleaned_name = cleaned_name[:-1] + str(i)
 
         return cleaned_name
+
+    def get_db(self, name):
+        """
+            Get a client for a configured database, built on first use and reused after that
+
+            Args:
+                name : str - The attribute name of the database on this config, e.g. 'default_1'
+
+            Returns:
+                BaseDb
+        """
+        with self._clients_lock:
+            if name not in self._clients:
+                if name not in self._named:
+                    raise KeyError('No database named %r in config, must be one of %s' % (name, list(self._named)))
+                db = dict(**self._named[name])
+                db_type = db.pop('type', 'bigquery' if 'project' in db else 'postgres')
+                if db_type not in DB_TYPES:
+                    raise ValueError('Unknown type %r for database %r, must be one of %s'
+                                     % (db_type, name, sorted(DB_TYPES)))
+                self._clients[name] = DB_TYPES[db_type](**db)
+            return self._clients[name]
+
+    def fan_out(self, queries, max_workers=DEFAULT_FAN_OUT_WORKERS, timeout=None, storage=STORAGE_ROWS):
+        """
+            Run queries against many configured databases concurrently
+
+            Failures don't stop the other queries, they are collected in the errors of the result.
+            A query still running at its timeout is reported as a TimeoutError and left to finish
+            in the background, since a running query can't be interrupted from another thread.
+
+            Args:
+                queries : dict - The query to run for each database, keyed by the names used by get_db
+
+            Kwargs:
+                max_workers : int - The most queries to run at once
+                timeout : float - The most seconds each query can run for, None to wait as long as it takes
+                storage : str - How each QueryResult holds its data, 'rows', 'tuples' or 'columns'
+
+            Returns:
+                FanOutResult
+        """
+        dbs = dict((name, self.get_db(name)) for name in queries)
+        outcome = FanOutResult()
+        started = dict()
+
+        def run(name):
+            started[name] = time.time()
+            try:
+                return dbs[name].query(queries[name], storage=storage)
+            finally:
+                outcome.timings.setdefault(name, time.time() - started[name])
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = dict((executor.submit(run, name), name) for name in queries)
+            pending = set(futures)
+            while pending:
+                wait_for = timeout
+                if timeout is not None:
+                    # Wake up in time for the first running query to reach its timeout
+                    deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                    if deadlines:
+                        wait_for = max(min(deadlines) - time.time(), 0)
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = futures[future]
+                    if future.exception() is not None:
+                        outcome.errors[name] = future.exception()
+                    else:
+                        outcome.results[name] = future.result()
+
+                if timeout is not None:
+                    now = time.time()
+                    for future in list(pending):
+                        name = futures[future]
+                        if name in started and now - started[name] >= timeout:
+                            pending.discard(future)
+                            outcome.timings.setdefault(name, now - started[name])
+                            outcome.errors[name] = TimeoutError(
+                                'Query against %s timed out after %ss' % (name, timeout))
+        finally:
+            # Don't wait on queries that timed out
+            executor.shutdown(wait=False)
+
+        for name, error in six.iteritems(outcome.errors):
+            _log.warning('Query against %s failed : %r', name, error)
+        return outcome
+
+    def query_shards(self, names, query_string, order_by=None, limit=None, descending=False,
+                     max_workers=DEFAULT_FAN_OUT_WORKERS, timeout=None, storage=STORAGE_ROWS):
+        """
+            Run one query against every shard of a schema in parallel, and combine the results
+
+            With order_by, each shard returns its rows in that order and they are k-way merged,
+            so the combined result is ordered too. Otherwise the results are concatenated in the
+            order of names. A limit is pushed down to each shard, so none returns more rows than
+            the combined result can use.
+
+            Args:
+                names : list - The names of the shards, as used by get_db
+                query_string : str - The query to run on every shard
+
+            Kwargs:
+                order_by : str or list - The columns to order the result on
+                limit : int - The most rows to return
+                descending : bool - Order from largest to smallest
+                max_workers : int - The most shards to query at once
+                timeout : float - The most seconds each shard can take
+                storage : str - How the QueryResult holds its data, 'rows', 'tuples' or 'columns'
+
+            Returns:
+                QueryResult
+
+            Raises:
+                The error of the first shard that failed, since a partial result would be wrong
+        """
+        names = list(names)
+        sharded = shard_query(query_string, order_by=order_by, limit=limit, descending=descending)
+        outcome = self.fan_out(dict((name, sharded) for name in names), max_workers=max_workers,
+                               timeout=timeout, storage=STORAGE_TUPLES)
+        for name in names:
+            if name in outcome.errors:
+                raise outcome.errors[name]
+
+        return merge_results([outcome.results[name] for name in names], order_by=order_by,
+                             limit=limit, descending=descending, storage=storage)
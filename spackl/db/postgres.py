@@ -1,10 +1,252 @@
 """
     Class for using Postgres as a source database
 """
+import contextlib
+import datetime
+import io
+import itertools
+import logging
+import re
 import six
 import sqlalchemy
+import threading
+import uuid
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from six.moves import queue
+
+from spackl.metrics import NO_TIMING
+from spackl.result import DEFAULT_BATCH_SIZE, STORAGE_ROWS, STORAGE_TUPLES, _values_getter
+from spackl.util import CSVReader
+
+from . import aio
 from .base import BaseDb, get_default_db_conn_kwargs
+from .replicas import DEFAULT_BALANCER, DEFAULT_EJECT_AFTER, DEFAULT_EJECT_SECONDS, Replica, ReplicaSet
+
+_log = logging.getLogger(__name__)
+
+
+POSTGRES_DEFAULT_POOL_KWARGS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_pre_ping': False,
+    'pool_recycle': -1,
+}
+
+COPY_FORMATS = ('text', 'csv', 'binary')
+
+DEFAULT_PAGE_SIZE = 100
+# On a line of its own, so a statement ending in a -- comment can't comment it out
+_STATEMENT_SEPARATOR = '\n;\n'
+_VALUES_RE = re.compile(r'\bVALUES\s+%s', re.IGNORECASE)
+_PARAM_RE = re.compile(r'%\((\w+)\)s')
+_INDEX_COLUMN = '_spackl_index'
+
+# Statements the server can PREPARE
+_PREPARABLE_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|VALUES|WITH)\b', re.IGNORECASE)
+_STATEMENT_CACHE_INFO = '_spackl_statements'
+# What can come before a placeholder for the server to infer the type of its parameter
+_TYPED_BEFORE_RE = re.compile(r'(?:[=<>]|\b(?:LIKE|ILIKE|LIMIT|OFFSET))\s*$', re.IGNORECASE)
+_TYPED_AFTER_RE = re.compile(r'\s*::')
+_INSERT_VALUES_RE = re.compile(r'^\s*INSERT\b.*\bVALUES\b', re.IGNORECASE | re.DOTALL)
+
+_COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+_COPY_ESCAPE_RE = re.compile(r'\\(.)')
+
+
+def _unescape_copy_value(value):
+    if value == '\\N':
+        return None
+    return _COPY_ESCAPE_RE.sub(lambda m: _COPY_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+class _CopyTextWriter(io.TextIOBase):
+    """
+        Writable target for COPY ... TO STDOUT in text format, parsing rows into tuples as the data arrives
+    """
+    def __init__(self):
+        self.rows = list()
+        self._partial = ''
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if '\\' in line:
+                self.rows.append(tuple([_unescape_copy_value(v) for v in line.split('\t')]))
+            else:
+                self.rows.append(tuple(line.split('\t')))
+        return len(data)
+
+
+def _copy_text_value(value):
+    if value is None:
+        return '\\N'
+    if not isinstance(value, six.string_types):
+        value = six.text_type(value)
+    if '\\' in value or '\t' in value or '\n' in value or '\r' in value:
+        value = value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return value
+
+
+def _quote_identifier(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+_QUERY_RE = re.compile(r'^\s*(select|with|values)\b', re.IGNORECASE)
+
+
+def _split_points(low, high, partitions):
+    """
+        Split the range from low to high into partitions of about the same width
+
+        Works for integers, decimals, floats, dates and timestamps. Integer and date points are
+        rounded, so narrow ranges can get fewer points.
+
+        Returns:
+            list - The points between partitions, each greater than low and at most high
+    """
+    if low is None or high is None or partitions < 2 or not low < high:
+        return list()
+    span = high - low
+    if isinstance(span, datetime.timedelta):
+        # timedeltas can't be divided by each other on python 2, so work in microseconds
+        microseconds = (span.days * 86400 + span.seconds) * 1000000 + span.microseconds
+        step = datetime.timedelta(microseconds=microseconds // partitions)
+        points = [low + step * i for i in range(1, partitions)]
+    elif isinstance(low, six.integer_types):
+        points = [low + (span * i) // partitions for i in range(1, partitions)]
+    else:
+        points = [low + (span * i) / partitions for i in range(1, partitions)]
+    return sorted(set(p for p in points if low < p <= high))
+
+
+def _key_ranges(column, points):
+    """
+        Get the WHERE clauses and params covering every value of a column, split at the given points,
+        plus NULL
+
+        Returns:
+            list of tuples - [(where clause, params), ... ]
+    """
+    if not points:
+        return [('TRUE', dict())]
+    ranges = [('{} < %(_spackl_high)s'.format(column), {'_spackl_high': points[0]})]
+    for low, high in zip(points, points[1:]):
+        ranges.append(('{0} >= %(_spackl_low)s AND {0} < %(_spackl_high)s'.format(column),
+                       {'_spackl_low': low, '_spackl_high': high}))
+    ranges.append(('{} >= %(_spackl_low)s'.format(column), {'_spackl_low': points[-1]}))
+    ranges.append(('{} IS NULL'.format(column), dict()))
+    return ranges
+
+
+_COPY_END = object()
+
+
+def _typed_params(query_string, params):
+    """
+        Get the names of the params of a query in order, if it can be prepared without changing what it does
+
+        PREPARE leaves the server to infer the type of each parameter from where it is used. Tuples,
+        which the driver expands for IN, and lists can't be bound that way, and a parameter used
+        only where its type can't be inferred, like SELECT %(x)s, would come back as text.
+        So each parameter has to be compared, cast, limited on or inserted at least once.
+
+        Returns:
+            list of str, or None if the query should be run as it is
+    """
+    if any(isinstance(v, (tuple, list)) for v in six.itervalues(params)):
+        return None
+    inserting = _INSERT_VALUES_RE.match(query_string)
+    names = list()
+    typed = set()
+    for match in _PARAM_RE.finditer(query_string):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        before = query_string[max(match.start() - 10, 0):match.start()]
+        if (_TYPED_BEFORE_RE.search(before) or _TYPED_AFTER_RE.match(query_string, match.end())
+                or (inserting and inserting.end() <= match.start() and before.rstrip()[-1:] in ('(', ','))):
+            typed.add(name)
+    if len(typed) < len(names):
+        return None
+    return names
+
+
+class _StatementCache(object):
+    """
+        The statements prepared on one pooled connection, least recently used first
+    """
+    def __init__(self):
+        self.statements = OrderedDict()
+        self.counter = itertools.count()
+
+
+class _CopyLoader(object):
+    """
+        Serializes the rows of a result into COPY text format on a background thread,
+        handing the chunks to COPY ... FROM STDIN as it calls read()
+
+        Args:
+            result : BaseResult - The rows to serialize
+            batch_size : int - The number of rows per chunk
+    """
+    def __init__(self, result, batch_size):
+        self.rows = 0
+        self.bytes = 0
+        self._done = False
+        self._queue = queue.Queue(maxsize=4)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(result, batch_size))
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+
+    def _put(self, item):
+        # Give up once stopped, so a failed COPY doesn't leave this thread blocked on a full queue
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _produce(self, result, batch_size):
+        try:
+            for batch in result.iter_batches(batch_size):
+                if self._stopped.is_set():
+                    return
+                lines = ['\t'.join([_copy_text_value(v) for v in values]) for values in batch.list()]
+                self._put((len(lines), ('\n'.join(lines) + '\n').encode('utf-8')))
+        except Exception as e:
+            self._put(e)
+        else:
+            self._put(_COPY_END)
+
+    def read(self, size=-1):
+        if self._done:
+            return b''
+        item = self._queue.get()
+        if item is _COPY_END:
+            self._done = True
+            return b''
+        if isinstance(item, Exception):
+            self._done = True
+            raise item
+        rows, data = item
+        self.rows += rows
+        self.bytes += len(data)
+        return data
 
 
 class Postgres(BaseDb):
@@ -16,27 +258,73 @@ class Postgres(BaseDb):
             conn_string : str - The connection url used to build the engine.
                                 If provided, overrides any conn_kwargs.
             conn_params : dict - Parameters to pass to the connection
+            stream_results : bool - Run every query through a named server-side cursor, so rows are
+                                    fetched in batches instead of buffered client-side all at once.
+                                    Statements run with execute() and friends are never streamed,
+                                    since server-side cursors only take SELECT and VALUES.
+            batch_size : int - The number of rows to fetch per round trip when streaming
+            cache : ResultCache - Keep the results of non-lazy queries run outside a session here,
+                                  returning them again for the same query and params
+            coalesce : bool - Let concurrent identical non-lazy queries outside a session share one run
+            replicas : list - Read replicas to send queries to, each a connection url or a dict of
+                              the conn_kwargs that differ from the primary's (host, port, etc).
+                              Statements, sessions, loads and merges always go to the primary.
+            balancer : str or object - How to choose a replica for each read, 'round_robin',
+                                       'least_outstanding' or 'latency', or an object with a
+                                       choose(replicas) method
+            eject_after : int - Connection failures in a row before a replica is left out
+            eject_seconds : float - How long a failing replica is left out for
+            statement_cache_size : int - Prepare up to this many queries on each pooled connection with
+                                         PREPARE, running them again with EXECUTE so the server skips
+                                         parsing and planning them. Off by default. Only used for
+                                         SELECT, INSERT, UPDATE, DELETE and VALUES queries whose params
+                                         the server can infer the types of, and not for streamed queries.
+                                         Queries the server won't prepare are run as they are.
             conn_kwargs : Use in place of a query string to set individual
                           attributes of the connection defaults
-                          (host, user, etc)
+                          (host, user, etc), or the connection pool defaults
+                          (pool_size, max_overflow, pool_pre_ping, pool_recycle)
     """
     _db_type = 'postgresql'
+    _savepoints = True
 
-    def __init__(self, name=None, conn_string=None, conn_params={}, **conn_kwargs):
+    def __init__(self, name=None, conn_string=None, conn_params={}, stream_results=False,
+                 batch_size=DEFAULT_BATCH_SIZE, cache=None, coalesce=False, replicas=None,
+                 balancer=DEFAULT_BALANCER, eject_after=DEFAULT_EJECT_AFTER, eject_seconds=DEFAULT_EJECT_SECONDS,
+                 statement_cache_size=0, **conn_kwargs):
         self._name = name
+        self.cache = cache
+        self._coalesce_queries = coalesce
+        self._stream_results = stream_results
+        self._conn_params = dict(**conn_params)
+        self._batch_size = batch_size
+        self._local = threading.local()
+        self._statement_cache_size = statement_cache_size
+        self._statement_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._statement_lock = threading.Lock()
+
+        self._pool_kwargs = dict(**POSTGRES_DEFAULT_POOL_KWARGS)
+        for k, v in six.iteritems(conn_kwargs):
+            if k in self._pool_kwargs:
+                self._pool_kwargs[k] = v
 
         if conn_string is not None:
             if not isinstance(conn_string, six.string_types):
                 raise ValueError('conn_string kwarg must be a valid string')
-            self._engine = sqlalchemy.create_engine(conn_string, connect_args=conn_params)
+            self._engine = self._create_engine(conn_string)
         else:
             self._conn_kwargs = dict(**get_default_db_conn_kwargs())
             for k, v in six.iteritems(conn_kwargs):
                 if k in self._conn_kwargs:
                     self._conn_kwargs[k] = v
             url = sqlalchemy.engine.url.URL(self._db_type, **self._conn_kwargs)
-            self._engine = sqlalchemy.create_engine(url, connect_args=conn_params)
-            self._engine.execution_options(stream_results=True)
+            self._engine = self._create_engine(url)
+
+        self._replicas = None
+        if replicas:
+            self._replicas = ReplicaSet(
+                [self._create_replica(replica) for replica in replicas],
+                balancer=balancer, eject_after=eject_after, eject_seconds=eject_seconds)
 
     def __repr__(self):
         return '<{db.__class__.__name__}({db._engine.url.host})>'.format(db=self)
@@ -45,24 +333,763 @@ class Postgres(BaseDb):
     def name(self):
         return self._name
 
+    @property
+    def replicas(self):
+        """
+            Get the read replicas queries are sent to
+
+            Returns:
+                ReplicaSet, or None without replicas
+        """
+        return self._replicas
+
+    def _create_engine(self, url):
+        return sqlalchemy.create_engine(url, connect_args=self._conn_params, **self._pool_kwargs)
+
+    def _create_replica(self, replica):
+        """
+            Build a Replica from a connection url, or a dict of the conn_kwargs that differ from the primary's
+        """
+        if isinstance(replica, six.string_types):
+            url = sqlalchemy.engine.url.make_url(replica)
+        else:
+            url = sqlalchemy.engine.url.make_url(str(self._engine.url))
+            overrides = dict((k, v) for k, v in six.iteritems(replica) if k in get_default_db_conn_kwargs())
+            if hasattr(url, 'set'):
+                url = url.set(**overrides)
+            else:
+                for k, v in six.iteritems(overrides):
+                    setattr(url, k, v)
+        return Replica(url.host, self._create_engine(url))
+
+    def _connect_read(self):
+        """
+            Check out a connection for a read that outlives one call, e.g. a lazy query,
+            from a replica when there are any
+        """
+        if self._replicas is None:
+            return self._engine.connect()
+        return self._replicas.checkout(self._engine)[1]
+
     def _connect(self):
         self._conn = self._engine.connect()
 
     def _close(self):
         self._conn.close()
 
-    def _query(self, query_string, **kwargs):
-        return self._conn.execute(query_string, **kwargs)
+    def _stream(self, conn, batch_size=None):
+        """
+            Get a branch of the connection that runs queries through a named server-side cursor
+
+            Args:
+                conn : sqlalchemy.engine.Connection - The connection to branch from
+
+            Kwargs:
+                batch_size : int - The most rows to buffer per fetch, defaults to the instance batch_size
+
+            Returns:
+                sqlalchemy.engine.Connection
+        """
+        return conn.execution_options(stream_results=True, max_row_buffer=batch_size or self._batch_size)
+
+    @contextlib.contextmanager
+    def _connection(self, timing=NO_TIMING, read=False):
+        """
+            Get the connection to run a statement on
+
+            Uses the thread's session connection if there is one, or the connection opened by an
+            explicit connect(), which is closed afterwards. Otherwise checks a connection out of the
+            pool just for this statement, so concurrent calls from other threads don't share it.
+            Reads go to a replica when there are any.
+
+            Kwargs:
+                timing : _Timing - Times checking out the connection as the 'connect' phase
+                read : bool - The statement only reads, so it can run on a replica
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+        elif self._conn is not None:
+            try:
+                yield self._conn
+            finally:
+                self.close()
+        elif read and self._replicas is not None:
+            with self._replicas.connection(self._engine, timing) as conn:
+                yield conn
+        else:
+            with timing.phase('connect'):
+                conn = self._engine.connect()
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+            Run every query and execute on one pooled connection until the block exits
+
+            The connection keeps its session state (temp tables, SET, etc) between statements and
+            goes back to the pool afterwards. Sessions belong to the thread that opened them, so
+            one instance can serve a thread pool with a session per worker. Nested sessions in the
+            same thread reuse the outer connection. Lazy queries and iter_batches still stream on
+            connections of their own.
+
+            Usage:
+                with pg.session() as s:
+                    s.execute('CREATE TEMP TABLE ids AS SELECT ...')
+                    s.query('SELECT * FROM ids')
+
+            Returns:
+                this instance, with the session active
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            yield self
+            return
+
+        self._local.conn = self._engine.connect()
+        try:
+            yield self
+        finally:
+            conn, self._local.conn = self._local.conn, None
+            conn.close()
+
+    @property
+    def in_session(self):
+        """
+            Check if the current thread has a session open
+
+            Returns:
+                bool
+        """
+        return getattr(self._local, 'conn', None) is not None
+
+    def _cache_identity(self):
+        if self.in_session:
+            # Session state like temp tables and SET can change what a query returns
+            return None
+        return (self.__class__.__name__, str(self._engine.url))
+
+    @property
+    def statement_cache_stats(self):
+        """
+            Get the prepared statement cache's counters, across every pooled connection
+
+            Returns:
+                dict - {'hits': queries run from a prepared statement, 'misses': queries prepared,
+                        'evictions': statements deallocated to make room}
+        """
+        with self._statement_lock:
+            return dict(self._statement_stats)
+
+    def _count_statement(self, counter):
+        with self._statement_lock:
+            self._statement_stats[counter] += 1
+
+    def _prepared(self, conn, query_string, params):
+        """
+            Get a query running the prepared statement for query_string on this connection,
+            preparing it first if it isn't prepared yet
+
+            Returns:
+                str - The EXECUTE query, or query_string itself if it can't be prepared
+        """
+        names = _typed_params(query_string, params)
+        if names is None:
+            return query_string
+
+        # The pooled connection's info is cleared when it reconnects, along with its statements
+        cache = conn.info.get(_STATEMENT_CACHE_INFO)
+        if cache is None:
+            cache = conn.info[_STATEMENT_CACHE_INFO] = _StatementCache()
+
+        if query_string in cache.statements:
+            # Re-insert to mark it as the most recently used
+            statement = cache.statements.pop(query_string)
+            cache.statements[query_string] = statement
+            if statement is None:
+                return query_string
+            self._count_statement('hits')
+        else:
+            if conn.in_transaction() and not self._savepoints:
+                # A failed PREPARE would abort the transaction, with no savepoint to go back to
+                return query_string
+            self._count_statement('misses')
+            statement = '_spackl_stmt_{}'.format(next(cache.counter))
+            body = _PARAM_RE.sub(lambda m: '${}'.format(names.index(m.group(1)) + 1), query_string)
+            if params:
+                # The driver unescapes %% when it fills in params, which PREPARE skips
+                body = body.replace('%%', '%')
+            try:
+                with conn.begin_nested():
+                    conn.execute('PREPARE {} AS {}'.format(statement, body.strip().rstrip(';')))
+            except sqlalchemy.exc.DBAPIError as e:
+                # Remember the failure, so the query isn't prepared again on this connection
+                _log.debug('Could not prepare query, running it as it is : %s', e)
+                statement = None
+
+            while len(cache.statements) >= self._statement_cache_size:
+                _, evicted = cache.statements.popitem(last=False)
+                if evicted is not None:
+                    conn.execute('DEALLOCATE {}'.format(evicted))
+                self._count_statement('evictions')
+            cache.statements[query_string] = statement
+            if statement is None:
+                return query_string
+
+        if not names:
+            return 'EXECUTE {}'.format(statement)
+        return 'EXECUTE {}({})'.format(statement, ', '.join('%({})s'.format(n) for n in names))
+
+    def _query(self, conn, query_string, **kwargs):
+        if (self._statement_cache_size
+                and isinstance(query_string, six.string_types) and _PREPARABLE_RE.match(query_string)):
+            query_string = self._prepared(conn, query_string, kwargs)
+        return conn.execute(query_string, **kwargs)
 
-    def query(self, query_string, **kwargs):
+    def _query_all(self, query_string, storage, key, **kwargs):
         from .result import QueryResult
-        self.connect()
-        result = self._query(query_string, **kwargs)
-        self.close()
-        return QueryResult(result)
+        with self._instrument('query', query_string) as timing:
+            with self._connection(timing, read=True) as conn:
+                with timing.phase('execute'):
+                    if self._stream_results:
+                        # Prepared statements can't be run through a server-side cursor
+                        result = self._stream(conn).execute(query_string, **kwargs)
+                    else:
+                        result = self._query(conn, query_string, **kwargs)
+                with timing.phase('fetch'):
+                    result = QueryResult(result, storage=storage)
+            timing.count(result)
+        self._cache_put(key, result)
+        return result
+
+    def query(self, query_string, storage=STORAGE_ROWS, lazy=False, **kwargs):
+        from .result import LazyQueryResult
+        if lazy:
+            with self._instrument('query', query_string) as timing:
+                # Stream on a connection of its own, released once the result runs out of rows
+                with timing.phase('connect'):
+                    conn = self._connect_read()
+                try:
+                    with timing.phase('execute'):
+                        result = self._stream(conn).execute(query_string, **kwargs)
+                        return LazyQueryResult(result, storage=storage, on_close=conn.close)
+                except Exception:
+                    conn.close()
+                    raise
+
+        key = self._query_key(query_string, kwargs, storage)
+        result = self._cache_get(key)
+        if result is None:
+            result = self._coalesce(key, lambda: self._query_all(query_string, storage, key, **kwargs))
+        return result
+
+    def query_many(self, query_string, param_sets, page_size=DEFAULT_PAGE_SIZE, storage=STORAGE_ROWS):
+        """
+            Run the same parameterized query for many sets of parameters, fusing up to page_size
+            of them into one round trip
+
+            Each page is sent as one UNION ALL of the query with each set of parameters, tagged
+            with the index of its set, so the parameters keep the types they would have in
+            separate queries. The combined rows are then split back into one result per set.
+
+            Usage:
+                results = pg.query_many('SELECT * FROM users WHERE id = %(id)s', [{'id': 1}, {'id': 2}])
+
+            Args:
+                query_string : str - The query to run, with %(name)s placeholders
+                param_sets : list of dict - The parameters for each run of the query
+
+            Kwargs:
+                page_size : int - The most parameter sets to run per round trip
+                storage : str - How each QueryResult holds its data, 'rows', 'tuples' or 'columns'
+
+            Returns:
+                list of QueryResult - One per parameter set, in the same order
+        """
+        from .result import QueryResult
+        param_sets = list(param_sets)
+        query_string = query_string.strip().rstrip(';')
+        keys = None
+        rows = [list() for _ in param_sets]
+
+        with self._instrument('query_many', query_string) as timing:
+            with self._connection(timing, read=True) as conn:
+                for start in range(0, len(param_sets), page_size):
+                    parts = list()
+                    params = dict()
+                    for i in range(start, min(start + page_size, len(param_sets))):
+                        prefix = '_spackl_{}_'.format(i)
+                        parts.append('SELECT {0:d} AS {1}, _spackl_query.* FROM ({2}) AS _spackl_query'.format(
+                            i, _INDEX_COLUMN, _PARAM_RE.sub(r'%({}\1)s'.format(prefix), query_string)))
+                        params.update((prefix + k, v) for k, v in six.iteritems(param_sets[i]))
+
+                    with timing.phase('execute'):
+                        result = self._query(conn, '\nUNION ALL\n'.join(parts), **params)
+                    with timing.phase('fetch'):
+                        page = QueryResult(result, storage=STORAGE_TUPLES)
+                    if page._keys:
+                        keys = list(page._keys)[1:]
+                    for row in page.list():
+                        rows[row[0]].append(row[1:])
+
+        return [QueryResult._from_values(keys or list(), values, storage) for values in rows]
 
     def execute(self, query_string, **kwargs):
-        self.connect()
-        with self._conn.begin():
-            self._query(query_string, **kwargs)
-        self.close()
+        with self._instrument('execute', query_string) as timing:
+            with self._connection(timing) as conn:
+                with timing.phase('execute'):
+                    with conn.begin():
+                        self._query(conn, query_string, **kwargs)
+
+    def execute_many(self, statements, param_sets=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+            Run many statements, or one statement with many sets of parameters, in one transaction
+            on one connection, packing them into as few round trips as possible
+
+            A list of statements is sent page_size statements at a time, as one script each.
+            A statement with param_sets is run with psycopg2's execute_values when it has a single
+            VALUES %s placeholder, expanded into multi-row VALUES lists, or with execute_batch otherwise.
+            Anything failing rolls the whole transaction back.
+
+            Usage:
+                pg.execute_many(['CREATE TABLE t (id int, name text)', 'CREATE INDEX ON t (id)'])
+                pg.execute_many('INSERT INTO t (id, name) VALUES %s', [(1, 'a'), (2, 'b')])
+                pg.execute_many('UPDATE t SET name = %(name)s WHERE id = %(id)s', [{'id': 1, 'name': 'z'}])
+
+            Args:
+                statements : list or str - The statements to run, or one statement to run with each set of params
+
+            Kwargs:
+                param_sets : list - The parameters for each run of the statement, as tuples or dicts
+                page_size : int - The most statements or parameter sets to send per round trip
+
+            Returns:
+                dict - {'statements': statements run, 'round_trips': round trips made}
+        """
+        from psycopg2.extras import execute_batch, execute_values
+        if param_sets is not None:
+            if not isinstance(statements, six.string_types):
+                raise ValueError('param_sets can only be used with a single statement')
+            param_sets = list(param_sets)
+            count = len(param_sets)
+        else:
+            if isinstance(statements, six.string_types):
+                statements = [statements]
+            statements = [s.strip().rstrip(';') for s in statements if s.strip().rstrip(';')]
+            count = len(statements)
+        round_trips = (count + page_size - 1) // page_size
+
+        query = statements if param_sets is not None else _STATEMENT_SEPARATOR.join(statements)
+        with self._instrument('execute_many', query) as timing:
+            with self._connection(timing) as conn:
+                with timing.phase('execute'):
+                    with conn.begin():
+                        cursor = conn.connection.cursor()
+                        try:
+                            if param_sets is None:
+                                for i in range(0, count, page_size):
+                                    cursor.execute(_STATEMENT_SEPARATOR.join(statements[i:i + page_size]))
+                            elif _VALUES_RE.search(statements):
+                                execute_values(cursor, statements, param_sets, page_size=page_size)
+                            else:
+                                execute_batch(cursor, statements, param_sets, page_size=page_size)
+                        finally:
+                            cursor.close()
+
+        _log.info('Ran %s statements in %s round trips', count, round_trips)
+        return {'statements': count, 'round_trips': round_trips}
+
+    def _connect_async(self):
+        """
+            Open a psycopg2 connection in async mode, with the engine's connection arguments
+        """
+        import psycopg2
+        cargs, cparams = self._engine.dialect.create_connect_args(self._engine.url)
+        cparams.update(self._conn_params)
+        return psycopg2.connect(*cargs, async_=True, **cparams)
+
+    def _run_async(self, query_string, params, on_done, loop=None):
+        """
+            Run a statement on a new async connection, polled from the event loop
+
+            Args:
+                query_string : str - The statement to run
+                params : dict - Parameters to pass to the driver
+                on_done : callable - Called with the cursor once the statement finishes
+
+            Kwargs:
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+
+            Returns:
+                asyncio.Future - Resolves to the return value of on_done
+        """
+        loop = aio.get_loop(loop)
+        result = loop.create_future()
+        try:
+            conn = self._connect_async()
+            fd = conn.fileno()
+        except Exception as e:
+            result.set_exception(e)
+            return result
+        cursors = list()
+
+        def fail(e):
+            if not result.done():
+                result.set_exception(e)
+
+        def executed():
+            value = on_done(cursors[0])
+            if not result.done():
+                result.set_result(value)
+
+        def connected():
+            cursors.append(conn.cursor())
+            cursors[0].execute(query_string, params or None)
+            aio.poll_connection(loop, conn, executed, fail)
+
+        def finish(result):
+            loop.remove_reader(fd)
+            loop.remove_writer(fd)
+            if result.cancelled():
+                try:
+                    conn.cancel()
+                except Exception as e:
+                    _log.warning('Could not cancel query : %s', e)
+            conn.close()
+
+        result.add_done_callback(finish)
+        aio.poll_connection(loop, conn, connected, fail)
+        return result
+
+    def query_async(self, query_string, storage=STORAGE_ROWS, loop=None, **kwargs):
+        """
+            Run a query from an asyncio event loop, on psycopg2's non-blocking async mode
+
+            The query runs on a connection of its own, outside the pool and any session, and the
+            connection's socket is watched from the loop, so no thread is tied up waiting on the database.
+            Cancelling the future cancels the query. Results aren't cached or coalesced.
+
+            Args:
+                query_string : str - The query to run against the database
+
+            Kwargs:
+                storage : str - How the QueryResult holds its data, 'rows', 'tuples' or 'columns'
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                kwargs : Parameters to pass to the driver
+
+            Returns:
+                asyncio.Future - Resolves to the QueryResult, can be awaited
+        """
+        from .result import QueryResult
+
+        def fetch(cursor):
+            if cursor.description is None:
+                return QueryResult(storage=storage)
+            keys = [column[0] for column in cursor.description]
+            return QueryResult._from_values(keys, cursor.fetchall(), storage)
+
+        return self._run_async(query_string, kwargs, fetch, loop=loop)
+
+    def execute_async(self, query_string, loop=None, **kwargs):
+        """
+            Run a statement from an asyncio event loop, on psycopg2's non-blocking async mode
+
+            Async connections are in autocommit mode, so the statement is committed as soon as it
+            finishes. Run several statements that need one transaction with execute_async on a
+            single string, or with execute().
+
+            Args:
+                query_string : str - The statement to run against the database
+
+            Kwargs:
+                loop : asyncio.AbstractEventLoop - The loop to run on, defaults to the current loop
+                kwargs : Parameters to pass to the driver
+
+            Returns:
+                asyncio.Future - Resolves to None once the statement is done, can be awaited
+        """
+        return self._run_async(query_string, kwargs, lambda cursor: None, loop=loop)
+
+    def _iter_batches(self, query_string, batch_size, storage):
+        return self.iter_batches(query_string, batch_size=batch_size, storage=storage)
+
+    def iter_batches(self, query_string, batch_size=None, storage=STORAGE_ROWS, **kwargs):
+        """
+            Run a query through a named server-side cursor, yielding its rows in batches as they are fetched
+
+            Only one batch is held in memory at a time, however big the result is.
+            The query runs on a connection of its own, released once the rows run out
+            or the generator is closed.
+
+            Args:
+                query_string : str - The query to run against the database
+
+            Kwargs:
+                batch_size : int - The number of rows to fetch per round trip, defaults to the instance batch_size
+                storage : str - How each batch holds its data, 'rows', 'tuples' or 'columns'
+                kwargs : Arbitrary parameters to pass to the query engine
+
+            Returns:
+                generator of QueryResult
+        """
+        from .result import QueryResult
+        batch_size = batch_size or self._batch_size
+        conn = self._connect_read()
+        try:
+            result = self._stream(conn, batch_size).execute(query_string, **kwargs)
+            keys = list(result.keys())
+            get_values = _values_getter(keys)
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield QueryResult._from_values(keys, [get_values(row) for row in rows], storage)
+        finally:
+            conn.close()
+
+    def copy_query(self, query_string, sink=None, format='text', storage=STORAGE_ROWS, **kwargs):
+        """
+            Run a query as COPY (...) TO STDOUT, skipping the per-row overhead of fetching through a cursor
+
+            With a sink the raw COPY output is written straight to it. Otherwise the output is parsed
+            into a QueryResult, with column names taken from the cursor description. Parsed values are
+            the strings Postgres prints for them, not python types. The text format keeps NULLs as None,
+            the csv format reads them as empty strings.
+
+            Args:
+                query_string : str - The query to copy the results of
+
+            Kwargs:
+                sink : file-like - Writable object to stream the raw output to, instead of parsing it
+                format : str - The COPY format, 'text', 'csv' or 'binary'. Binary needs a sink.
+                storage : str - How the QueryResult holds its data, 'rows', 'tuples' or 'columns'
+                kwargs : Parameters to interpolate into the query, since COPY can't take bind parameters
+
+            Returns:
+                QueryResult, or the number of rows copied when writing to a sink
+        """
+        from .result import QueryResult
+        if format not in COPY_FORMATS:
+            raise ValueError('format must be one of %s, not %r' % (COPY_FORMATS, format))
+        if format == 'binary' and sink is None:
+            raise ValueError('Binary COPY output can only be written to a sink')
+
+        with self._connection(read=True) as conn:
+            cursor = conn.connection.cursor()
+            try:
+                if kwargs:
+                    query_string = cursor.mogrify(query_string, kwargs)
+                    if isinstance(query_string, bytes):
+                        query_string = query_string.decode('utf-8')
+                query_string = query_string.strip().rstrip(';')
+                copy_sql = 'COPY ({}) TO STDOUT WITH (FORMAT {})'.format(query_string, format)
+
+                if sink is not None:
+                    cursor.copy_expert(copy_sql, sink)
+                    return cursor.rowcount
+
+                # COPY doesn't describe its output, so get the column names from an empty run of the query
+                cursor.execute('SELECT * FROM ({}) AS _spackl_copy LIMIT 0'.format(query_string))
+                keys = [column[0] for column in cursor.description]
+
+                if format == 'text':
+                    writer = _CopyTextWriter()
+                    cursor.copy_expert(copy_sql, writer)
+                    values = writer.rows
+                else:
+                    buf = io.StringIO()
+                    cursor.copy_expert(copy_sql, buf)
+                    buf.seek(0)
+                    values = [tuple(row) for row in CSVReader(buf)]
+            finally:
+                cursor.close()
+
+        return QueryResult._from_values(keys, values, storage)
+
+    def load(self, table, result, columns=None, batch_size=None):
+        """
+            Bulk load a result into a table with COPY ... FROM STDIN, in one transaction
+
+            A background thread serializes the rows in batches while COPY streams them to the server.
+            Values are sent as their str() and parsed by Postgres into the column types.
+
+            Args:
+                table : str - The table to load into, optionally schema qualified
+                result : BaseResult - The rows to load, e.g. a QueryResult or the FileResult of CSV.query().
+                                      A LazyQueryResult is streamed through without being held in memory.
+
+            Kwargs:
+                columns : list - The table columns to load the result keys into, in the same order.
+                                 Defaults to the result keys.
+                batch_size : int - The number of rows to serialize per batch, defaults to the instance batch_size
+
+            Returns:
+                dict - {'rows': rows loaded, 'bytes': bytes sent}
+        """
+        columns = list(columns or result.keys())
+        if not columns:
+            raise ValueError('Cannot load a result without keys')
+        if len(columns) != len(result._keys):
+            raise ValueError('columns must name one table column for each result key')
+
+        copy_sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT text, ENCODING \'UTF8\')'.format(
+            table, ', '.join([_quote_identifier(c) for c in columns]))
+
+        with self._connection() as conn:
+            with conn.begin():
+                cursor = conn.connection.cursor()
+                try:
+                    with _CopyLoader(result, batch_size or self._batch_size) as loader:
+                        cursor.copy_expert(copy_sql, loader)
+                finally:
+                    cursor.close()
+
+        _log.info('Loaded %s rows (%s bytes) into %s', loader.rows, loader.bytes, table)
+        return {'rows': loader.rows, 'bytes': loader.bytes}
+
+    def extract(self, source, column, partitions=None, split_points=None, sink=None,
+                max_workers=None, batch_size=None, storage=STORAGE_ROWS):
+        """
+            Pull a big table or query in parallel, split into ranges of a key column
+
+            Each range runs through a server-side cursor on a pooled connection of its own, so the
+            database can scan the ranges on several cores at once. Without split_points the column's
+            min and max are queried and split into partitions of about the same width, which works
+            best on an indexed integer or timestamp column with evenly spread values. Rows with a
+            NULL key are fetched as a range of their own.
+
+            Args:
+                source : str - A table name, optionally schema qualified, or a SELECT query
+                column : str - The key column to split on
+
+            Kwargs:
+                partitions : int - The number of ranges to split into, defaults to max_workers
+                split_points : list - Explicit values to split the ranges at, instead of min/max
+                sink : callable - Called with each batch (a QueryResult) as it arrives, one call
+                                  at a time, instead of collecting the rows into one result
+                max_workers : int - The most ranges to pull at once, defaults to the pool_size
+                batch_size : int - The number of rows to fetch per round trip, defaults to the instance batch_size
+                storage : str - How the result, or each batch sent to the sink, holds its data
+
+            Returns:
+                QueryResult with the rows of every range in range order,
+                or when given a sink, dict - {'rows': rows extracted, 'ranges': ranges pulled}
+        """
+        from .result import QueryResult
+        max_workers = max_workers or self._pool_kwargs['pool_size']
+        partitions = partitions or max_workers
+        if _QUERY_RE.match(source):
+            relation = '({}) AS _spackl_extract'.format(source.strip().rstrip(';'))
+        else:
+            relation = source
+        quoted = _quote_identifier(column)
+
+        if split_points is None:
+            bounds = self.query('SELECT min({0}), max({0}) FROM {1}'.format(quoted, relation), storage=STORAGE_TUPLES)
+            low, high = bounds.list()[0] if bounds else (None, None)
+            split_points = _split_points(low, high, partitions)
+        ranges = _key_ranges(quoted, sorted(split_points))
+
+        sink_lock = threading.Lock()
+        stopped = threading.Event()
+
+        def pull(where, params):
+            rows = list()
+            count = 0
+            keys = None
+            range_query = 'SELECT * FROM {} WHERE {}'.format(relation, where)
+            for batch in self.iter_batches(range_query, batch_size=batch_size,
+                                           storage=storage if sink else STORAGE_TUPLES, **params):
+                if stopped.is_set():
+                    break
+                keys = batch._keys
+                count += len(batch)
+                if sink is None:
+                    rows.extend(batch.list())
+                else:
+                    with sink_lock:
+                        sink(batch)
+            return keys, count, rows
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = list()
+        try:
+            futures.extend(executor.submit(pull, where, params) for where, params in ranges)
+            pieces = [future.result() for future in futures]
+        except Exception:
+            # Stop the other ranges early instead of pulling rows nobody will see
+            stopped.set()
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+
+        total = sum(count for _, count, _ in pieces)
+        _log.info('Extracted %s rows from %s in %s ranges', total, source, len(ranges))
+        if sink is not None:
+            return {'rows': total, 'ranges': len(ranges)}
+
+        keys = next((keys for keys, _, _ in pieces if keys is not None), None)
+        if keys is None:
+            return QueryResult(storage=storage)
+        return QueryResult._from_values(keys, [row for _, _, rows in pieces for row in rows], storage)
+
+    def _create_staging(self, conn, staging, table):
+        conn.execute('CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP'.format(staging, table))
+
+    def _stage(self, staging, result, columns, batch_size):
+        return self.load(staging, result, columns=columns, batch_size=batch_size)
+
+    def _apply_staged(self, conn, staging, table, columns, key_columns):
+        quoted = ', '.join([_quote_identifier(c) for c in columns])
+        updates = [_quote_identifier(c) for c in columns if c not in key_columns]
+        if updates:
+            action = 'DO UPDATE SET ' + ', '.join(['{0} = EXCLUDED.{0}'.format(c) for c in updates])
+        else:
+            action = 'DO NOTHING'
+        merge_sql = 'INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} ON CONFLICT ({keys}) {action}'.format(
+            table=table, cols=quoted, staging=staging, action=action,
+            keys=', '.join([_quote_identifier(c) for c in key_columns]))
+        return conn.execute(merge_sql).rowcount
+
+    def merge(self, table, result, key_columns, columns=None, batch_size=None):
+        """
+            Upsert a result into a table by key, as one set-based statement instead of row by row
+
+            The rows are bulk loaded into a temp table, then applied to the table with
+            INSERT ... ON CONFLICT, all on one connection in one transaction. The key columns
+            need a unique index or constraint on the table, and must be unique within the result.
+
+            Args:
+                table : str - The table to merge into, optionally schema qualified
+                result : BaseResult - The rows to merge
+                key_columns : list - The columns identifying a row
+
+            Kwargs:
+                columns : list - The table columns to load the result keys into, in the same order.
+                                 Defaults to the result keys.
+                batch_size : int - The number of rows to stage per batch, defaults to the instance batch_size
+
+            Returns:
+                dict - {'rows': rows staged, 'bytes': bytes sent, 'merged': rows inserted or updated}
+        """
+        columns = list(columns or result.keys())
+        if isinstance(key_columns, six.string_types):
+            key_columns = [key_columns]
+        missing = [k for k in key_columns if k not in columns]
+        if not key_columns or missing:
+            raise ValueError('key_columns must be among the merged columns, not found : %r' % missing)
+
+        staging = '_spackl_merge_{}'.format(uuid.uuid4().hex)
+        with self.session():
+            with self._connection() as conn:
+                with conn.begin():
+                    self._create_staging(conn, staging, table)
+                    stats = self._stage(staging, result, columns, batch_size)
+                    stats['merged'] = self._apply_staged(conn, staging, table, columns, key_columns)
+
+        _log.info('Merged %s rows into %s', stats['merged'], table)
+        return stats
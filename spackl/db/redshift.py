@@ -1,11 +1,20 @@
 """
     Class for using Redshift as a source database
 """
-from .postgres import Postgres
+import logging
+
+from .postgres import Postgres, _quote_identifier
+
+# Redshift rejects statements over 16 MB
+MAX_STATEMENT_BYTES = 16 * 1024 * 1024
+
+_log = logging.getLogger(__name__)
 
 
 class Redshift(Postgres):
     _db_type = 'redshift+psycopg2'
+    # Redshift has no SAVEPOINT
+    _savepoints = False
 
     def __init__(self, *args, **kwargs):
         port = 5439
@@ -16,3 +25,95 @@ class Redshift(Postgres):
 
         super(Redshift, self).__init__(
             *args, port=port, conn_params=conn_params, **kwargs)
+
+    def insert(self, table, result, columns=None, max_statement_bytes=MAX_STATEMENT_BYTES, batch_size=None):
+        """
+            Insert a result into a table with multi-row INSERT ... VALUES statements, in one transaction
+
+            Redshift handles many small inserts poorly, so the rows are packed into the largest
+            statements that fit under max_statement_bytes. Each statement is reported to the listeners
+            as an 'insert' QueryEvent with the rows and bytes it sent.
+            For big loads, COPY from S3 is still much faster.
+
+            Args:
+                table : str - The table to insert into, optionally schema qualified
+                result : BaseResult - The rows to insert. A LazyQueryResult is streamed through
+                                      without being held in memory.
+
+            Kwargs:
+                columns : list - The table columns to insert the result keys into, in the same order.
+                                 Defaults to the result keys.
+                max_statement_bytes : int - The largest statement to send, Redshift's limit is 16 MB
+                batch_size : int - The number of rows to read from the result at a time,
+                                   defaults to the instance batch_size
+
+            Returns:
+                dict - {'rows': rows inserted, 'bytes': bytes sent, 'statements': statements executed}
+        """
+        columns = list(columns or result.keys())
+        if not columns:
+            raise ValueError('Cannot insert a result without keys')
+        if len(columns) != len(result._keys):
+            raise ValueError('columns must name one table column for each result key')
+
+        placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        statement = 'INSERT INTO {} ({}) VALUES '.format(table, ', '.join([_quote_identifier(c) for c in columns]))
+        prefix = statement.encode('utf-8')
+
+        stats = {'rows': 0, 'bytes': 0, 'statements': 0}
+        with self._connection() as conn:
+            with conn.begin():
+                cursor = conn.connection.cursor()
+
+                def send(values, size):
+                    # Events carry the statement without its values, which can run to megabytes
+                    with self._instrument('insert', statement + '...') as timing:
+                        with timing.phase('execute'):
+                            cursor.execute(prefix + b', '.join(values))
+                        timing.record(len(values), size)
+                    stats['rows'] += len(values)
+                    stats['bytes'] += size
+                    stats['statements'] += 1
+                    _log.debug('Inserted %s rows (%s bytes) into %s', len(values), size, table)
+
+                try:
+                    values, size = list(), len(prefix)
+                    for batch in result.iter_batches(batch_size or self._batch_size):
+                        for row in batch.list():
+                            value = cursor.mogrify(placeholders, row)
+                            # Each value after the first also needs its ', ' separator
+                            if values and size + 2 + len(value) > max_statement_bytes:
+                                send(values, size)
+                                values, size = list(), len(prefix)
+                            if len(prefix) + len(value) > max_statement_bytes:
+                                raise ValueError(
+                                    'A row of %s bytes does not fit in a %s byte statement'
+                                    % (len(value), max_statement_bytes))
+                            size += len(value) + (2 if values else 0)
+                            values.append(value)
+                    if values:
+                        send(values, size)
+                finally:
+                    cursor.close()
+
+        _log.info('Inserted %s rows (%s bytes) into %s in %s statements',
+                  stats['rows'], stats['bytes'], table, stats['statements'])
+        return stats
+
+    def _create_staging(self, conn, staging, table):
+        conn.execute('CREATE TEMP TABLE {} (LIKE {})'.format(staging, table))
+
+    def _stage(self, staging, result, columns, batch_size):
+        # Redshift can't COPY from STDIN, so stage with multi-row inserts instead
+        return self.insert(staging, result, columns=columns, batch_size=batch_size)
+
+    def _apply_staged(self, conn, staging, table, columns, key_columns):
+        # Redshift has no ON CONFLICT, so replace matching rows with a delete and insert
+        quoted = ', '.join([_quote_identifier(c) for c in columns])
+        match = ' AND '.join(['{table}.{col} = {staging}.{col}'.format(
+            table=table, staging=staging, col=_quote_identifier(c)) for c in key_columns])
+        conn.execute('DELETE FROM {} USING {} WHERE {}'.format(table, staging, match))
+        merged = conn.execute('INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging}'.format(
+            table=table, cols=quoted, staging=staging)).rowcount
+        conn.execute('DROP TABLE {}'.format(staging))
+        return merged
@@ -0,0 +1,232 @@
+"""
+    Routing reads across read replicas, with pluggable load balancing and ejection of failing hosts
+"""
+import contextlib
+import itertools
+import logging
+import random
+import six
+import sqlalchemy
+import threading
+import time
+
+from spackl.metrics import NO_TIMING
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_BALANCER = 'round_robin'
+DEFAULT_EJECT_AFTER = 3
+DEFAULT_EJECT_SECONDS = 30
+
+# How much each new query time moves a replica's latency estimate
+LATENCY_DECAY = 0.3
+
+
+class Replica(object):
+    """
+        A read replica and what is known about its health and load
+
+        Attributes:
+            name : str - The host of the replica
+            engine : sqlalchemy.engine.Engine - The engine connecting to it
+            outstanding : int - The number of queries running on it
+            latency : float - Moving average of its query time in seconds, None until a query finishes
+            failures : int - Connection failures since its last success
+            ejected_until : float - The time it gets to take queries again, if it has been ejected
+    """
+    __slots__ = ['name', 'engine', 'outstanding', 'latency', 'failures', 'ejected_until']
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = 0
+
+    def __repr__(self):
+        return '<Replica({})>'.format(self.name)
+
+
+class RoundRobin(object):
+    """
+        Send queries to each healthy replica in turn
+    """
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, replicas):
+        return replicas[next(self._counter) % len(replicas)]
+
+
+class LeastOutstanding(object):
+    """
+        Send queries to the replica running the fewest queries, ties going to the first
+    """
+    def choose(self, replicas):
+        return min(replicas, key=lambda r: r.outstanding)
+
+
+class LatencyWeighted(object):
+    """
+        Send queries to replicas at random, weighted towards the ones answering fastest
+
+        Replicas without a measured latency are tried first, so every replica gets measured.
+    """
+    def choose(self, replicas):
+        unmeasured = [r for r in replicas if r.latency is None]
+        if unmeasured:
+            return unmeasured[0]
+        weights = [1.0 / max(r.latency, 0.001) for r in replicas]
+        pick = random.uniform(0, sum(weights))
+        for replica, weight in zip(replicas, weights):
+            pick -= weight
+            if pick <= 0:
+                return replica
+        return replicas[-1]
+
+
+BALANCERS = {
+    'round_robin': RoundRobin,
+    'least_outstanding': LeastOutstanding,
+    'latency': LatencyWeighted,
+}
+
+
+def get_balancer(balancer):
+    """
+        Get a balancer from its name, or pass a balancer object through
+
+        Args:
+            balancer : str or object - 'round_robin', 'least_outstanding' or 'latency', or any object
+                                       with a choose(replicas) method returning one of the replicas
+
+        Returns:
+            balancer object
+    """
+    if isinstance(balancer, six.string_types):
+        if balancer not in BALANCERS:
+            raise ValueError('balancer must be one of %s, not %r' % (sorted(BALANCERS), balancer))
+        return BALANCERS[balancer]()
+    if not hasattr(balancer, 'choose'):
+        raise TypeError('balancer must be a name or have a choose(replicas) method')
+    return balancer
+
+
+class ReplicaSet(object):
+    """
+        A set of read replicas, choosing one for each read and ejecting replicas that keep failing
+
+        A replica is ejected for eject_seconds after eject_after connection failures in a row. While
+        every replica is ejected, reads go to the primary instead. Errors in the query itself, like
+        a bad column name, don't count against the replica.
+
+        Args:
+            replicas : list of Replica - The replicas to choose from
+
+        Kwargs:
+            balancer : str or object - How to choose a replica, see get_balancer
+            eject_after : int - Connection failures in a row before a replica is ejected
+            eject_seconds : float - How long an ejected replica is left out for
+    """
+    def __init__(self, replicas, balancer=DEFAULT_BALANCER, eject_after=DEFAULT_EJECT_AFTER,
+                 eject_seconds=DEFAULT_EJECT_SECONDS):
+        self.replicas = list(replicas)
+        self._balancer = get_balancer(balancer)
+        self._eject_after = eject_after
+        self._eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<ReplicaSet: {}>'.format(self.replicas)
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def healthy(self):
+        """
+            Get the replicas that haven't been ejected
+
+            Returns:
+                list of Replica
+        """
+        now = time.time()
+        return [r for r in self.replicas if r.ejected_until <= now]
+
+    def record_failure(self, replica):
+        with self._lock:
+            replica.failures += 1
+            if replica.failures >= self._eject_after:
+                replica.failures = 0
+                replica.ejected_until = time.time() + self._eject_seconds
+                _log.warning('Ejecting replica %s for %ss after %s failures',
+                             replica.name, self._eject_seconds, self._eject_after)
+
+    def record_success(self, replica, seconds):
+        with self._lock:
+            replica.failures = 0
+            if replica.latency is None:
+                replica.latency = seconds
+            else:
+                replica.latency += LATENCY_DECAY * (seconds - replica.latency)
+
+    def checkout(self, fallback):
+        """
+            Connect to a healthy replica, trying the others if the connection fails
+
+            Args:
+                fallback : sqlalchemy.engine.Engine - The engine to use when no replica can be reached
+
+            Returns:
+                tuple - (Replica or None when falling back, sqlalchemy.engine.Connection)
+        """
+        tried = set()
+        while True:
+            with self._lock:
+                candidates = [r for r in self.healthy() if id(r) not in tried]
+                replica = self._balancer.choose(candidates) if candidates else None
+            if replica is None:
+                _log.warning('No healthy replica, reading from the primary')
+                return None, fallback.connect()
+            tried.add(id(replica))
+            try:
+                return replica, replica.engine.connect()
+            except Exception as e:
+                _log.warning('Could not connect to replica %s : %s', replica.name, e)
+                self.record_failure(replica)
+
+    @contextlib.contextmanager
+    def connection(self, fallback, timing=NO_TIMING):
+        """
+            Check out a connection for one read, tracking the replica's load, latency and health
+
+            Args:
+                fallback : sqlalchemy.engine.Engine - The engine to use when no replica can be reached
+
+            Kwargs:
+                timing : _Timing - Times the checkout as the 'connect' phase
+        """
+        with timing.phase('connect'):
+            replica, conn = self.checkout(fallback)
+        if replica is None:
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        with self._lock:
+            replica.outstanding += 1
+        start = time.time()
+        try:
+            yield conn
+        except sqlalchemy.exc.DBAPIError as e:
+            if e.connection_invalidated or isinstance(e, sqlalchemy.exc.OperationalError):
+                self.record_failure(replica)
+            raise
+        else:
+            self.record_success(replica, time.time() - start)
+        finally:
+            with self._lock:
+                replica.outstanding -= 1
+            conn.close()
@@ -7,18 +7,44 @@ from collections import OrderedDict
 from google.cloud.bigquery.table import RowIterator
 from sqlalchemy.engine import ResultProxy
 
-from spackl.result import BaseResult
+from spackl.result import (
+    BaseResult,
+    DEFAULT_BATCH_SIZE,
+    ResultRow,
+    STORAGE_ROWS,
+    STORAGE_TYPES,
+    _as_schema,
+    _split_rows,
+    _store_values,
+    _values_getter)
+
+
+def _check_query_iterator(query_iterator):
+    if not isinstance(query_iterator, (RowIterator, ResultProxy)):
+        raise TypeError(
+            'DbQueryResult instantiated with invalid result type : %s. Must be a sqlalchemy.engine.ResultProxy,'
+            ' returned by a call to sqlalchemy.engine.Connection.execute(), or a google.cloud.bigquery.table.'
+            'RowIterator, returned by a call to google.cloud.bigquery.Client.query().result()'
+            % type(query_iterator))
 
 
 class QueryResult(BaseResult):
-    def __init__(self, query_iterator=None):
+    """
+        The result of a query against a source database
+
+        Kwargs:
+            query_iterator : ResultProxy or RowIterator - The rows returned by the database driver
+            storage : str - 'rows' (default), 'tuples' or 'columns', see BaseResult
+    """
+    def __init__(self, query_iterator=None, storage=STORAGE_ROWS):
         if query_iterator is not None:
-            if not isinstance(query_iterator, (RowIterator, ResultProxy)):
-                raise TypeError(
-                    'DbQueryResult instantiated with invalid result type : %s. Must be a sqlalchemy.engine.ResultProxy,'
-                    ' returned by a call to sqlalchemy.engine.Connection.execute(), or a google.cloud.bigquery.table.'
-                    'RowIterator, returned by a call to google.cloud.bigquery.Client.query().result()'
-                    % type(query_iterator))
+            _check_query_iterator(query_iterator)
+
+            if storage != STORAGE_ROWS:
+                # Skip building a dict per row, the values go straight into tuples or columns
+                keys, values = _split_rows(query_iterator)
+                super(QueryResult, self).__init__(keys, values, storage=storage)
+                return
 
             result = [OrderedDict(row) for row in query_iterator]
         else:
@@ -31,7 +57,193 @@ class QueryResult(BaseResult):
         else:
             keys = list()
 
-        super(QueryResult, self).__init__(keys, result)
+        super(QueryResult, self).__init__(keys, result, storage=storage)
 
     def __repr__(self):
-        return '<QueryResult: {qr._result}>'.format(qr=self)
+        return '<QueryResult: {}>'.format(self._dicts())
+
+
+class LazyQueryResult(QueryResult):
+    """
+        A QueryResult that pulls rows from the database driver only as they are needed
+
+        Iterating over the result streams rows as they arrive, keeping them for later use.
+        iter_batches() streams rows without keeping them, for results too big to hold in memory.
+        Anything that needs the whole result (len, slicing, df(), etc) fetches the remaining rows first.
+
+        Args:
+            query_iterator : ResultProxy or RowIterator - The rows returned by the database driver
+
+        Kwargs:
+            storage : str - 'rows' (default), 'tuples' or 'columns', see BaseResult
+            on_close : callable - Called once the driver runs out of rows or the result is closed,
+                                  e.g. to release the connection the query ran on
+    """
+    def __init__(self, query_iterator, storage=STORAGE_ROWS, on_close=None):
+        _check_query_iterator(query_iterator)
+        if storage not in STORAGE_TYPES:
+            raise ValueError('Storage must be one of %s, not %r' % (STORAGE_TYPES, storage))
+
+        self._loaded = False
+        self._loaded_result = None
+        self._loaded_columns = None
+        self._consumed = False
+        self._source = iter(query_iterator)
+        self._on_close = on_close
+        self._buffer = list()
+
+        # The keys come from the first row, so fetch it up front
+        keys = list()
+        first = next(self._source, None)
+        if first is None:
+            self._finish()
+        else:
+            keys = list(first.keys())
+            self._get_values = _values_getter(keys)
+            self._buffer.append(self._get_values(first))
+
+        super(LazyQueryResult, self).__init__(storage=storage)
+        self._keys = _as_schema(keys)
+
+    def __repr__(self):
+        if self._loaded:
+            return super(LazyQueryResult, self).__repr__()
+        return '<LazyQueryResult: {} rows buffered>'.format(len(self._buffer))
+
+    def __bool__(self):
+        if not self._loaded:
+            return bool(self._buffer) or self._pull()
+        return super(LazyQueryResult, self).__bool__()
+
+    __nonzero__ = __bool__
+
+    def __next__(self):
+        if self._loaded:
+            return super(LazyQueryResult, self).__next__()
+        self._index += 1
+        while len(self._buffer) < self._index:
+            if not self._pull():
+                raise StopIteration
+        return ResultRow(self._keys, self._buffer[self._index - 1])
+
+    next = __next__
+
+    @classmethod
+    def _from_part(cls, keys, result, storage=STORAGE_ROWS):
+        # Slices and filters of a lazy result are already fully loaded
+        return QueryResult._from_part(keys, result, storage)
+
+    @property
+    def _result(self):
+        self._fetch_all()
+        return self._loaded_result
+
+    @_result.setter
+    def _result(self, value):
+        self._loaded_result = value
+
+    @property
+    def _columns(self):
+        self._fetch_all()
+        return self._loaded_columns
+
+    @_columns.setter
+    def _columns(self, value):
+        self._loaded_columns = value
+
+    @property
+    def pending(self):
+        """
+            Check if the result is still waiting on rows from the database
+
+            Returns:
+                bool
+        """
+        return not self._loaded
+
+    def _pull(self):
+        """
+            Fetch the next row from the source into the buffer
+
+            Returns:
+                bool - False if the source has no more rows
+        """
+        if self._source is None:
+            return False
+        try:
+            row = next(self._source)
+        except StopIteration:
+            self._finish()
+            return False
+        self._buffer.append(self._get_values(row))
+        return True
+
+    def _finish(self):
+        self._source = None
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+
+    def _fetch_all(self):
+        if self._loaded:
+            return
+        if self._consumed:
+            raise RuntimeError(
+                'Rows of this LazyQueryResult were streamed by iter_batches or dropped by close, '
+                'so the full result is no longer available')
+        while self._pull():
+            pass
+        values, self._buffer = self._buffer, list()
+        self._loaded = True
+        self._set_storage(_store_values(self._keys, values, self._storage), self._storage)
+
+    def fetch(self):
+        """
+            Fetch every remaining row, turning this into a fully loaded result
+
+            Returns:
+                LazyQueryResult - self
+        """
+        self._fetch_all()
+        return self
+
+    def close(self):
+        """
+            Stop fetching rows and release the source. Rows not yet fetched are dropped.
+        """
+        if not self._loaded:
+            self._consumed = True
+            self._buffer = list()
+            self._finish()
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+            Stream the result as QueryResults of up to batch_size rows each, as the rows arrive
+
+            Rows streamed this way are not kept, so the full result can't be used afterwards.
+            A result that has already been fully fetched is simply sliced.
+
+            Kwargs:
+                batch_size : int - The most rows to put in each batch
+
+            Returns:
+                generator of QueryResult
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        if self._loaded:
+            for batch in super(LazyQueryResult, self).iter_batches(batch_size):
+                yield batch
+            return
+
+        self._consumed = True
+        try:
+            while self._buffer or self._source is not None:
+                while len(self._buffer) < batch_size and self._pull():
+                    pass
+                batch, self._buffer = self._buffer[:batch_size], self._buffer[batch_size:]
+                if batch:
+                    yield QueryResult._from_values(self._keys, batch, self._storage)
+        finally:
+            self._buffer = list()
+            self._finish()
@@ -0,0 +1,113 @@
+"""
+    Helpers for running one query across many shards of the same schema
+"""
+import heapq
+import six
+
+from itertools import islice
+
+from spackl.result import STORAGE_ROWS
+
+from .postgres import _quote_identifier
+from .result import QueryResult
+
+
+class _Descending(object):
+    """
+        Wraps a sort key so it sorts in reverse, since heapq.merge can't reverse on python 2
+    """
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _as_list(order_by):
+    if order_by is None:
+        return list()
+    if isinstance(order_by, six.string_types):
+        return [order_by]
+    return list(order_by)
+
+
+def shard_query(query_string, order_by=None, limit=None, descending=False):
+    """
+        Wrap a query to run on each shard, ordering it and pushing the limit down so no shard
+        returns more rows than the merged result can use
+
+        Args:
+            query_string : str - The query to run on every shard
+
+        Kwargs:
+            order_by : str or list - The columns the result is ordered on
+            limit : int - The most rows to return in total
+            descending : bool - Order from largest to smallest
+
+        Returns:
+            str
+    """
+    order_by = _as_list(order_by)
+    if not order_by and limit is None:
+        return query_string
+
+    wrapped = 'SELECT * FROM ({}) AS _spackl_shard'.format(query_string.strip().rstrip(';'))
+    if order_by:
+        direction = ' DESC' if descending else ''
+        wrapped += ' ORDER BY ' + ', '.join([_quote_identifier(c) + direction for c in order_by])
+    if limit is not None:
+        wrapped += ' LIMIT {:d}'.format(limit)
+    return wrapped
+
+
+def merge_results(results, order_by=None, limit=None, descending=False, storage=STORAGE_ROWS):
+    """
+        Combine the results of each shard into one, k-way merging them if they are ordered
+
+        NULLs sort last, or first when descending, as they do in Postgres.
+
+        Args:
+            results : list of BaseResult - The result from each shard, in shard order
+
+        Kwargs:
+            order_by : str or list - The columns each result is ordered on. Without it,
+                                     the results are concatenated in shard order.
+            limit : int - The most rows to return
+            descending : bool - The results are ordered from largest to smallest
+            storage : str - How the merged QueryResult holds its data, 'rows', 'tuples' or 'columns'
+
+        Returns:
+            QueryResult
+    """
+    results = [r for r in results if len(r)]
+    if not results:
+        return QueryResult(storage=storage)
+
+    keys = results[0]._keys
+    for result in results[1:]:
+        if result._keys != keys:
+            raise ValueError('Shard results have different keys : %s and %s' % (list(keys), list(result._keys)))
+    values = [r.list() for r in results]
+
+    order_by = _as_list(order_by)
+    if order_by:
+        positions = [keys.index(c) for c in order_by]
+        wrap = _Descending if descending else (lambda key: key)
+
+        def decorated(index, rows):
+            # The shard and row index break ties, so rows themselves are never compared
+            for i, row in enumerate(rows):
+                yield wrap(tuple((row[p] is None, row[p]) for p in positions)), index, i, row
+
+        merged = (item[-1] for item in heapq.merge(*[decorated(i, rows) for i, rows in enumerate(values)]))
+    else:
+        merged = (row for rows in values for row in rows)
+
+    if limit is not None:
+        merged = islice(merged, limit)
+    return QueryResult._from_values(keys, list(merged), storage)
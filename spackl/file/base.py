@@ -1,7 +1,16 @@
+from spackl.cache import Cached
+from spackl.metrics import Instrumented
 from spackl.util import ABC, abstractmethod
 
 
-class BaseFile(ABC):
+class BaseFile(Instrumented, Cached, ABC):
+    """
+        Base class for file sources
+
+        Callables registered with add_listener() receive a spackl.metrics.QueryEvent
+        for each query, with its per-phase timings, row count and approximate bytes.
+        Setting cache to a spackl.cache.ResultCache keeps query results for reuse.
+    """
     _opened = False
     _data = None
 
@@ -52,6 +61,7 @@ class BaseFile(ABC):
             If not open, should call self.open() first
 
             Kwargs:
+                storage : str - How the FileResult holds its data, 'rows', 'tuples' or 'columns'
                 kwargs : Arbitrary parameters to pass to the query method
 
             Returns:
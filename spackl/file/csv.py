@@ -6,7 +6,8 @@ import logging
 import six
 import zipfile
 
-from spackl.util import DictReader, Path, Sniffer
+from spackl.result import STORAGE_ROWS
+from spackl.util import CSVReader, DictReader, Path, Sniffer
 
 from .base import BaseFile
 from .result import FileResult
@@ -26,10 +27,13 @@ class CSV(BaseFile):
             use_pandas : bool - Choose to use pandas to read the csv file, a better option if you plan
                                 to ultimately convert the result to a DataFrame.
                                 NOTE: This causes the query method to return a DataFrame instead of a FileResult
+            cache : ResultCache - Keep the results of queries here, returning them again for the same
+                                  kwargs until the file's mtime or size changes. Only used for file paths.
             csv_kwargs : Parameters to pass to the csv reader (fieldnames, delimiter, dialect, etc)
     """
-    def __init__(self, file_path_or_obj, name=None, use_pandas=False, **csv_kwargs):
+    def __init__(self, file_path_or_obj, name=None, use_pandas=False, cache=None, **csv_kwargs):
         self._name = name
+        self.cache = cache
         self._use_pandas = use_pandas
 
         self._file = None
@@ -64,6 +68,19 @@ class CSV(BaseFile):
                     file = zipfile.ZipFile(str(file))
         self._file = file
 
+    def _cache_identity(self):
+        if isinstance(self._file, zipfile.ZipFile):
+            path = Path(self._file.filename)
+        elif isinstance(self._file, Path):
+            path = self._file
+        else:
+            # File objects can't be told apart or checked for changes
+            return None
+        stat = path.stat()
+        # Keying on mtime and size drops the cached result as soon as the file changes
+        return (self.__class__.__name__, str(path), stat.st_mtime, stat.st_size,
+                sorted(six.iteritems(self._csv_kwargs)))
+
     def _open(self):
         if isinstance(self._file, zipfile.ZipFile):
             self._data = self._extract_zipfile()
@@ -90,25 +107,69 @@ class CSV(BaseFile):
         self._data.seek(0)
         return dialect
 
+    def _read_values(self, fieldnames=None, restkey=None, restval=None, **kwargs):
+        """
+            Read the open file straight into value tuples, skipping the dict DictReader builds per row
+
+            Takes the same kwargs as DictReader, except restkey since every row must match the keys
+
+            Returns:
+                tuple - (keys, [(value, ... ), ... ])
+        """
+        reader = CSVReader(self._data, **kwargs)
+        if fieldnames is None:
+            fieldnames = next(reader, list())
+        keys = list(fieldnames)
+        width = len(keys)
+
+        values = list()
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != width:
+                if len(row) > width:
+                    raise AttributeError('keys arg does not match all result keys')
+                row = row + [restval] * (width - len(row))
+            values.append(tuple(row))
+        return keys, values
+
     def _load_using_pandas(self, **kwargs):
         from pandas import read_csv
         return read_csv(self._file, **kwargs)
 
-    def query(self, use_pandas=False, pd_kwargs=dict(), **kwargs):
-        if use_pandas or self._use_pandas:
-            # Skip loading method and return a dataframe
-            return self._load_using_pandas(**pd_kwargs)
-
-        _kwargs = dict(**self._csv_kwargs)
-        _kwargs.update(**kwargs)
-
-        self.open()
-
-        if not _kwargs.get('dialect', None):
-            _kwargs['dialect'] = self._get_dialect()
-
-        reader = DictReader(self._data, **_kwargs)
-        result = FileResult(list(reader))
-        self.close()
-
-        return result
+    def query(self, use_pandas=False, pd_kwargs=dict(), storage=STORAGE_ROWS, **kwargs):
+        use_pandas = use_pandas or self._use_pandas
+        if not use_pandas:
+            cache_key = self._query_key(params=kwargs, storage=storage)
+            result = self._cache_get(cache_key)
+            if result is not None:
+                return result
+
+        with self._instrument('query') as timing:
+            if use_pandas:
+                # Skip loading method and return a dataframe
+                with timing.phase('read'):
+                    return self._load_using_pandas(**pd_kwargs)
+
+            _kwargs = dict(**self._csv_kwargs)
+            _kwargs.update(**kwargs)
+
+            with timing.phase('open'):
+                self.open()
+
+            if not _kwargs.get('dialect', None):
+                with timing.phase('sniff'):
+                    _kwargs['dialect'] = self._get_dialect()
+
+            with timing.phase('read'):
+                if storage == STORAGE_ROWS:
+                    reader = DictReader(self._data, **_kwargs)
+                    result = FileResult(list(reader))
+                else:
+                    keys, values = self._read_values(**_kwargs)
+                    result = FileResult._from_values(keys, values, storage=storage)
+            self.close()
+
+            timing.count(result)
+            self._cache_put(cache_key, result)
+            return result
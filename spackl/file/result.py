@@ -4,11 +4,18 @@
 import collections
 import six
 
-from spackl.result import BaseResult
+from spackl.result import BaseResult, STORAGE_ROWS
 
 
 class FileResult(BaseResult):
-    def __init__(self, result_dicts=None):
+    """
+        The contents of a file read by a BaseFile
+
+        Kwargs:
+            result_dicts : list of OrderedDicts - The rows read from the file
+            storage : str - 'rows' (default), 'tuples' or 'columns', see BaseResult
+    """
+    def __init__(self, result_dicts=None, storage=STORAGE_ROWS):
         if result_dicts is not None:
             if not isinstance(result_dicts, list):
                 result_dicts = [result_dicts]
@@ -28,7 +35,7 @@ class FileResult(BaseResult):
         else:
             keys = list()
 
-        super(FileResult, self).__init__(keys, result_dicts)
+        super(FileResult, self).__init__(keys, result_dicts, storage=storage)
 
     def __repr__(self):
-        return '<FileResult: {fr._result}>'.format(fr=self)
+        return '<FileResult: {}>'.format(self._dicts())
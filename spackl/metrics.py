@@ -0,0 +1,230 @@
+"""
+    Hooks for timing queries against any source, and counting the rows and bytes they return
+"""
+import contextlib
+import logging
+import time
+
+from collections import OrderedDict
+
+_log = logging.getLogger(__name__)
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Listeners called for events from every source
+_listeners = list()
+
+BYTES_SAMPLE_SIZE = 100
+
+
+def add_listener(listener):
+    """
+        Register a callable to receive a QueryEvent for every query against every source
+
+        Args:
+            listener : callable - Called with each QueryEvent once its query finishes
+
+        Returns:
+            None
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """
+        Unregister a listener added with add_listener
+
+        Args:
+            listener : callable - The listener to remove
+
+        Returns:
+            None
+    """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def approximate_bytes(result, sample_size=BYTES_SAMPLE_SIZE):
+    """
+        Estimate the size of a result's data from the str() length of the values in a sample of its rows
+
+        Args:
+            result : BaseResult - The result to measure
+
+        Kwargs:
+            sample_size : int - The most rows to measure
+
+        Returns:
+            int
+    """
+    count = len(result)
+    if not count:
+        return 0
+    step = max(count // sample_size, 1)
+    indexes = range(0, count, step)
+    size = 0
+    for i in indexes:
+        row = result._row_at(i)
+        values = row.values() if isinstance(row, dict) else row
+        size += sum(len(str(v)) for v in values if v is not None)
+    return int(size * count / float(len(indexes)))
+
+
+class QueryEvent(object):
+    """
+        The timing and size of one query against a source
+
+        Attributes:
+            source : str - The class of the source, e.g. 'Postgres'
+            name : str - The name given to the source instance
+            operation : str - The method called, e.g. 'query' or 'execute'
+            query : str - The query string, or None for file sources
+            phases : OrderedDict - Seconds spent in each phase, in the order they ran
+                                   (e.g. connect, execute, fetch)
+            duration : float - Total seconds from start to finish
+            rows : int - The number of rows returned, or None if not known (e.g. lazy results)
+            bytes : int - Approximate size of the returned data, or None if not known
+            error : Exception - The exception raised, if the query failed
+    """
+    __slots__ = ['source', 'name', 'operation', 'query', 'phases', 'duration', 'rows', 'bytes', 'error']
+
+    def __init__(self, source, name, operation, query=None):
+        self.source = source
+        self.name = name
+        self.operation = operation
+        self.query = query
+        self.phases = OrderedDict()
+        self.duration = None
+        self.rows = None
+        self.bytes = None
+        self.error = None
+
+    def __repr__(self):
+        return '<QueryEvent: {e.source}.{e.operation} duration={e.duration} rows={e.rows}>'.format(e=self)
+
+
+class _Timing(object):
+    """
+        Collects a QueryEvent as a query runs, and sends it to the listeners when the block exits
+    """
+    def __init__(self, event, listeners):
+        self.event = event
+        self._listeners = listeners
+        self._start = None
+
+    def __enter__(self):
+        self._start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.event.duration = _clock() - self._start
+        self.event.error = exc
+        for listener in self._listeners:
+            try:
+                listener(self.event)
+            except Exception as e:
+                # A broken listener must never break the query
+                _log.warning('Metrics listener %r failed : %s', listener, e)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = _clock()
+        try:
+            yield
+        finally:
+            self.event.phases[name] = self.event.phases.get(name, 0) + _clock() - start
+
+    def count(self, result):
+        """
+            Record the rows and approximate bytes of a result, unless it is still being fetched
+        """
+        # Results look up unknown attributes as keys, so check the class for the property
+        if hasattr(type(result), 'pending') and result.pending:
+            return
+        self.event.rows = len(result)
+        self.event.bytes = approximate_bytes(result)
+
+    def record(self, rows, bytes):
+        """
+            Record rows and bytes counted by the caller, e.g. for rows sent rather than returned
+        """
+        self.event.rows = rows
+        self.event.bytes = bytes
+
+
+class _NoTiming(object):
+    """
+        Stands in for _Timing when nothing is listening, so uninstrumented queries pay nothing
+    """
+    event = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        yield
+
+    def count(self, result):
+        pass
+
+    def record(self, rows, bytes):
+        pass
+
+
+NO_TIMING = _NoTiming()
+
+
+class Instrumented(object):
+    """
+        Mixin for sources that report a QueryEvent to their listeners for each query
+    """
+    _listeners = ()
+
+    def add_listener(self, listener):
+        """
+            Register a callable to receive a QueryEvent for every query against this source
+
+            Args:
+                listener : callable - Called with each QueryEvent once its query finishes
+
+            Returns:
+                None
+        """
+        if listener not in self._listeners:
+            self._listeners = self._listeners + (listener,)
+
+    def remove_listener(self, listener):
+        """
+            Unregister a listener added with add_listener
+
+            Args:
+                listener : callable - The listener to remove
+
+            Returns:
+                None
+        """
+        self._listeners = tuple(x for x in self._listeners if x != listener)
+
+    def _instrument(self, operation, query=None):
+        """
+            Start timing a query, to be used as a context manager around the whole call
+
+            Args:
+                operation : str - The method being called
+
+            Kwargs:
+                query : str - The query string being run
+
+            Returns:
+                _Timing, or NO_TIMING when nothing is listening
+        """
+        listeners = self._listeners + tuple(_listeners)
+        if not listeners:
+            return NO_TIMING
+        event = QueryEvent(self.__class__.__name__, getattr(self, 'name', None), operation, query)
+        return _Timing(event, listeners)
@@ -1,9 +1,183 @@
 import copy
 import json
+import operator
 import six
 
+from collections import OrderedDict
+from itertools import compress
+
 from spackl.util import DtDecEncoder
 
+STORAGE_ROWS = 'rows'
+STORAGE_TUPLES = 'tuples'
+STORAGE_COLUMNS = 'columns'
+STORAGE_TYPES = (STORAGE_ROWS, STORAGE_TUPLES, STORAGE_COLUMNS)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _transpose(rows, width):
+    """
+        Turn a list of row value tuples into a list of column value tuples
+
+        Args:
+            rows : list of tuples - The row values, each ordered like the result keys
+            width : int - The number of columns, used when there are no rows
+
+        Returns:
+            list of tuples - [(value, ... ), ... ], one tuple per column
+    """
+    if not rows:
+        return [tuple() for _ in range(width)]
+    return list(zip(*rows))
+
+
+def _values_getter(keys):
+    """
+        Build a function that gets the values of a mapping-like row as a tuple ordered like keys
+
+        Args:
+            keys : list - The keys every row is expected to have
+
+        Returns:
+            callable - Takes a row supporting len() and lookup by key, e.g. RowProxy,
+                       bigquery Row or OrderedDict, and returns a tuple of its values.
+                       Raises AttributeError if the row's keys don't match.
+    """
+    width = len(keys)
+    if width == 1:
+        key = keys[0]
+        getter = lambda row: (row[key], )  # noqa: E731
+    elif width:
+        getter = operator.itemgetter(*keys)
+    else:
+        getter = lambda row: tuple()  # noqa: E731
+
+    def get_values(row):
+        if len(row) != width:
+            raise AttributeError('keys arg does not match all result keys')
+        try:
+            return getter(row)
+        except KeyError:
+            raise AttributeError('keys arg does not match all result keys')
+    return get_values
+
+
+def _split_rows(rows):
+    """
+        Split mapping-like rows into one shared list of keys and a tuple of values per row
+
+        Args:
+            rows : iterable - Rows supporting keys(), len() and lookup by key
+
+        Returns:
+            tuple - (keys, [(value, ... ), ... ])
+
+        Raises:
+            AttributeError if the keys of any row don't match the keys of the first row
+    """
+    keys = None
+    values = list()
+    for row in rows:
+        if keys is None:
+            keys = list(row.keys())
+            get_values = _values_getter(keys)
+        values.append(get_values(row))
+    return keys or list(), values
+
+
+class ResultSchema(object):
+    """
+        The keys (AKA column names) of a result along with the position of each key,
+        shared by every row of the result. Behaves like the list of keys it holds.
+
+        Args:
+            keys : list - The keys of the result
+    """
+    __slots__ = ['_keys', '_positions']
+
+    def __init__(self, keys):
+        self._keys = list(keys)
+        self._positions = dict()
+        for position, key in enumerate(self._keys):
+            # Duplicate column names resolve to the first one, like a list lookup would
+            self._positions.setdefault(key, position)
+
+    def __repr__(self):
+        return repr(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __getitem__(self, index):
+        return self._keys[index]
+
+    def __contains__(self, key):
+        try:
+            return key in self._positions
+        except TypeError:
+            return False
+
+    def __eq__(self, other):
+        if isinstance(other, ResultSchema):
+            return self is other or self._keys == other._keys
+        if isinstance(other, list):
+            return self._keys == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def index(self, key):
+        """
+            Get the position of the given key
+
+            Args:
+                key : str - The key to look up
+
+            Returns:
+                int
+
+            Raises:
+                ValueError if the key is not in the schema, same as list.index
+        """
+        try:
+            return self._positions[key]
+        except (KeyError, TypeError):
+            raise ValueError('%r is not in keys' % (key, ))
+
+
+def _store_values(keys, values, storage):
+    """
+        Convert a list of value tuples into the form the given storage keeps its data in
+
+        Args:
+            keys : list or ResultSchema - The keys the values are ordered by
+            values : list of tuples - The values of each row
+            storage : str - One of STORAGE_TYPES
+
+        Returns:
+            list - OrderedDict rows, tuple rows or column tuples
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError('Storage must be one of %s, not %r' % (STORAGE_TYPES, storage))
+    if storage == STORAGE_COLUMNS:
+        return _transpose(values, len(keys))
+    if storage == STORAGE_ROWS:
+        return [OrderedDict(zip(keys, row)) for row in values]
+    return values
+
+
+def _as_schema(keys):
+    if isinstance(keys, ResultSchema):
+        return keys
+    return ResultSchema(keys)
+
 
 class ResultRow(object):
     """
@@ -11,8 +185,9 @@ class ResultRow(object):
         on top of a single row of a query result
 
         Args:
-            keys : list - The keys (AKA column names) of the query result
-            row : OrderedDict - The row of data from the query result
+            keys : list or ResultSchema - The keys (AKA column names) of the query result
+            row : OrderedDict or tuple - The row of data from the query result,
+                                         tuples hold the values in the same order as keys
     """
     __slots__ = ['_keys', '_row']
 
@@ -37,13 +212,22 @@ class ResultRow(object):
     def __getitem__(self, key):
         if isinstance(key, six.string_types):
             # Return the column corresponding with this key
-            if key not in self._keys:
-                raise KeyError('Not found : %r' % key)
-            value = self._row[key]
+            if isinstance(self._row, tuple):
+                try:
+                    value = self._row[self._keys.index(key)]
+                except ValueError:
+                    raise KeyError('Not found : %r' % key)
+            else:
+                if key not in self._keys:
+                    raise KeyError('Not found : %r' % key)
+                value = self._row[key]
         elif isinstance(key, six.integer_types):
             # Return the column corresponding with this index
-            k = self._keys[key]
-            value = self._row[k]
+            if isinstance(self._row, tuple):
+                value = self._row[key]
+            else:
+                k = self._keys[key]
+                value = self._row[k]
         else:
             raise TypeError('Lookups must be done with integers or strings, not %s' % type(key))
         return value
@@ -51,23 +235,39 @@ class ResultRow(object):
     def __eq__(self, other):
         if not isinstance(other, ResultRow):
             return NotImplemented
+        if isinstance(self._row, tuple) or isinstance(other._row, tuple):
+            return self.values() == other.values() and self.keys() == other.keys()
         return self._row == other._row
 
     def __ne__(self, other):
         return not self == other
 
     def values(self):
+        if isinstance(self._row, tuple):
+            return self._row
         return tuple(six.itervalues(self._row))
 
     def keys(self):
+        if isinstance(self._row, tuple):
+            return list(self._keys)
         return list(six.iterkeys(self._row))
 
     def items(self):
-        for key, value in six.iteritems(self._row):
+        if isinstance(self._row, tuple):
+            pairs = zip(self._keys, self._row)
+        else:
+            pairs = six.iteritems(self._row)
+        for key, value in pairs:
             yield (key, value)
 
     def get(self, key, default=None):
-        value = self._row.get(key)
+        if isinstance(self._row, tuple):
+            try:
+                value = self._row[self._keys.index(key)]
+            except ValueError:
+                value = None
+        else:
+            value = self._row.get(key)
         if value is None:
             return default
         return value
@@ -176,26 +376,43 @@ class ResultCol(object):
 class BaseResult(object):
     """
         Base class for containing contents of a query result or a file
+
+        Args:
+            keys : list or ResultSchema - The keys (AKA column names) of the result
+            result : list - The rows of the result, as OrderedDicts or tuples of values ordered like keys
+
+        Kwargs:
+            storage : str - How the result is held in memory. 'rows' (the default) keeps the list of rows
+                            as given, 'tuples' keeps each row as a plain tuple of values, and 'columns'
+                            keeps one tuple per column, so column access is O(1) and rows are rebuilt
+                            only when asked for. Every row shares the result's ResultSchema.
     """
-    __slots__ = ['_index', '_keys', '_result']
+    __slots__ = ['_index', '_keys', '_result', '_columns', '_storage']
 
-    def __init__(self, keys, result):
-        if not isinstance(keys, list):
+    def __init__(self, keys, result, storage=STORAGE_ROWS):
+        if not isinstance(keys, (list, ResultSchema)):
             raise TypeError('Keys must be a list')
-        self._keys = keys
+        if storage not in STORAGE_TYPES:
+            raise ValueError('Storage must be one of %s, not %r' % (STORAGE_TYPES, storage))
+        self._keys = _as_schema(keys)
 
         if not isinstance(result, list):
             result = [result]
-        self._result = result
+
+        if storage != STORAGE_ROWS:
+            result = [row if isinstance(row, tuple) else tuple([row[k] for k in keys]) for row in result]
+            if storage == STORAGE_COLUMNS:
+                result = _transpose(result, len(keys))
+        self._set_storage(result, storage)
 
     def __repr__(self):
-        return '<BaseResult: {br._result}>'.format(br=self)
+        return '<BaseResult: {}>'.format(self._dicts())
 
     def __str__(self):
         return self.json()
 
     def __bool__(self):
-        return bool(self._result)
+        return bool(len(self))
 
     __nonzero__ = __bool__
 
@@ -206,7 +423,7 @@ class BaseResult(object):
     def __next__(self):
         self._index += 1
         try:
-            row = self._result[self._index - 1]
+            row = self._row_at(self._index - 1)
         except IndexError:
             raise StopIteration
         return ResultRow(self._keys, row)
@@ -221,44 +438,157 @@ class BaseResult(object):
             # Return the column corresponding with this key
             if key not in self._keys:
                 raise KeyError('Not found : %r' % key)
-            col = tuple([row[key] for row in self._result])
-            value = ResultCol(key, col)
+            value = ResultCol(key, self._column(key))
         elif isinstance(key, six.integer_types):
             # Return the row corresponding with this index
-            row = self._result[key]
+            row = self._row_at(key)
             value = ResultRow(self._keys, row)
         elif isinstance(key, slice):
             # Return the rows corresponding with this slice
-            sliced = [self._result[ii] for ii in range(*key.indices(len(self._result)))]
-            value = self._from_part(self._keys, sliced)
+            if self._columns is None:
+                sliced = [self._result[ii] for ii in range(*key.indices(len(self._result)))]
+            else:
+                sliced = [col[key] for col in self._columns]
+            value = self._from_part(self._keys, sliced, self._storage)
         else:
             raise TypeError('Lookups must be done with integers or strings, not %s' % type(key))
         return value
 
     def __len__(self):
-        return len(self._result)
+        if self._columns is None:
+            return len(self._result)
+        return len(self._columns[0]) if self._columns else 0
 
     def __eq__(self, other):
         if not isinstance(other, BaseResult):
             return NotImplemented
-        return self._result == other._result
+        if self._storage == other._storage == STORAGE_ROWS:
+            return self._result == other._result
+        return self._keys == other._keys and self.list() == other.list()
 
     def __ne__(self, other):
         return not self == other
 
     @classmethod
-    def _from_part(cls, keys, result):
+    def _from_part(cls, keys, result, storage=STORAGE_ROWS):
         """
             Get a new BaseResult from an existing sliced or filtered result
 
+            Args:
+                keys : list - The keys of the existing result
+                result : list - The rows, or the column tuples when storage is 'columns'
+
+            Kwargs:
+                storage : str - The storage of the existing result
+
             Returns:
                 BaseResult
         """
-        br = cls([], [])
-        br._keys = keys
-        br._result = result
+        br = cls.__new__(cls)
+        br._keys = _as_schema(keys)
+        br._set_storage(result, storage)
         return br
 
+    @classmethod
+    def _from_values(cls, keys, values, storage=STORAGE_ROWS):
+        """
+            Get a new BaseResult from a list of value tuples ordered like the keys
+
+            Args:
+                keys : list - The keys of the result
+                values : list of tuples - The values of each row
+
+            Kwargs:
+                storage : str - How the new result should hold its data
+
+            Returns:
+                BaseResult
+        """
+        schema = _as_schema(keys)
+        return cls._from_part(schema, _store_values(schema, values, storage), storage)
+
+    def _set_storage(self, result, storage):
+        self._storage = storage
+        if storage == STORAGE_COLUMNS:
+            self._result = None
+            self._columns = result
+        else:
+            self._result = result
+            self._columns = None
+
+    def _row_at(self, index):
+        """
+            Get the stored row at the given index, rebuilding it from the columns if needed
+        """
+        if self._columns is None:
+            return self._result[index]
+        if not self._columns:
+            raise IndexError('result index out of range')
+        return tuple([col[index] for col in self._columns])
+
+    def _store_row(self, row):
+        """
+            Convert a ResultRow's row into the form this result stores its rows in
+        """
+        if self._storage == STORAGE_ROWS:
+            if isinstance(row._row, tuple):
+                return OrderedDict(zip(self._keys, row._row))
+            return row._row
+        return row.values()
+
+    def _column(self, key):
+        """
+            Get the values of the column with the given key as a tuple
+        """
+        if self._storage == STORAGE_ROWS:
+            return tuple([row[key] for row in self._result])
+        if self._storage == STORAGE_TUPLES:
+            return tuple(map(operator.itemgetter(self._keys.index(key)), self._result))
+        return self._columns[self._keys.index(key)]
+
+    def _column_values(self):
+        """
+            Get every column of the result as a list of tuples ordered like the keys
+        """
+        if self._storage == STORAGE_ROWS:
+            return [self._column(k) for k in self._keys]
+        if self._storage == STORAGE_TUPLES:
+            return _transpose(self._result, len(self._keys))
+        return self._columns
+
+    def _dicts(self):
+        """
+            Get the rows of the result as OrderedDicts, without copying row storage
+        """
+        if self._storage == STORAGE_ROWS:
+            return self._result
+        if self._storage == STORAGE_TUPLES:
+            return [OrderedDict(zip(self._keys, values)) for values in self._result]
+        return [OrderedDict(zip(self._keys, values)) for values in zip(*self._columns)]
+
+    def _copy(self):
+        """
+            Get a new result sharing this one's rows, so either can be appended to or popped from
+            without changing the other
+        """
+        data = self._result if self._columns is None else self._columns
+        return self._from_part(self._keys, list(data), self._storage)
+
+    def _adopt_keys(self, keys):
+        self._keys = _as_schema(keys)
+        if self._columns is not None:
+            self._columns = [tuple() for _ in keys]
+
+    @property
+    def storage(self):
+        """
+            Get the way this result is held in memory, one of 'rows', 'tuples' or 'columns'
+
+            Returns:
+                str
+        """
+        return self._storage
+
     @property
     def empty(self):
         """
@@ -267,7 +597,7 @@ class BaseResult(object):
             Returns:
                 bool
         """
-        return bool(not self._keys and not self._result)
+        return bool(not self._keys and not len(self))
 
     @property
     def result(self):
@@ -277,7 +607,7 @@ class BaseResult(object):
             Returns:
                 list of dicts - [{column: value, ... }, ... ]
         """
-        return copy.deepcopy(self._result)
+        return copy.deepcopy(self._dicts())
 
     def dict(self):
         """
@@ -286,7 +616,7 @@ class BaseResult(object):
             Returns:
                 dict - {column: (value, ... ), ... }
         """
-        return {k: tuple([row[k] for row in self._result]) for k in self._keys}
+        return dict(zip(self._keys, self._column_values()))
 
     def json(self):
         """
@@ -295,7 +625,7 @@ class BaseResult(object):
             Returns:
                 string
         """
-        return json.dumps(self._result, cls=DtDecEncoder)
+        return json.dumps(self._dicts(), cls=DtDecEncoder)
 
     def list(self):
         """
@@ -304,7 +634,11 @@ class BaseResult(object):
             Returns:
                 list of tuples - [(value, ... ), ... ]
         """
-        return [tuple([v for v in six.itervalues(row)]) for row in self._result]
+        if self._storage == STORAGE_ROWS:
+            return [tuple([v for v in six.itervalues(row)]) for row in self._result]
+        if self._storage == STORAGE_TUPLES:
+            return list(self._result)
+        return list(zip(*self._columns))
 
     def df(self, *args, **kwargs):
         """
@@ -314,7 +648,9 @@ class BaseResult(object):
                 pandas.DataFrame
         """
         from pandas import DataFrame
-        return DataFrame(self._result, *args, **kwargs)
+        if self._storage == STORAGE_ROWS:
+            return DataFrame(self._result, *args, **kwargs)
+        return DataFrame(OrderedDict(zip(self._keys, self._column_values())), *args, **kwargs)
 
     def first(self):
         """
@@ -323,7 +659,22 @@ class BaseResult(object):
             Returns:
                 QueryResultRow
         """
-        return ResultRow(self._keys, self._result[0])
+        return ResultRow(self._keys, self._row_at(0))
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+            Iterate over the result in consecutive slices
+
+            Kwargs:
+                batch_size : int - The most rows to put in each slice
+
+            Returns:
+                generator of results of the same type and storage as this one
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        for start in range(0, len(self), batch_size):
+            yield self[start:start + batch_size]
 
     def values(self):
         for item in self.list():
@@ -354,22 +705,32 @@ class BaseResult(object):
             Returns:
                 QueryResultRow
         """
-        return ResultRow(self._keys, self._result.pop(index))
+        if self._columns is None:
+            return ResultRow(self._keys, self._result.pop(index))
+        row = self._row_at(index)
+        index = range(len(self))[index]
+        self._columns = [col[:index] + col[index + 1:] for col in self._columns]
+        return ResultRow(self._keys, row)
 
     def append(self, other):
         """
             Append a QueryResultRow with matching keys to the current result
 
+            Columnar results copy each column on append, so prefer extend when adding many rows
+
             Args:
                 other : QueryResultRow - The row to append
         """
         if not isinstance(other, ResultRow):
             raise NotImplementedError('Appending object must be a QueryResultRow')
         if self.empty:
-            self._keys = other._keys
+            self._adopt_keys(other._keys)
         elif self._keys != other._keys:
             raise ValueError('Keys in appending row do not match, cannot append')
-        self._result.append(other._row)
+        if self._columns is None:
+            self._result.append(self._store_row(other))
+        else:
+            self._columns = [col + (value, ) for col, value in zip(self._columns, other.values())]
 
     def extend(self, other):
         """
@@ -381,10 +742,15 @@ class BaseResult(object):
         if not isinstance(other, BaseResult):
             raise NotImplementedError('Extending object must be a QueryResult')
         if self.empty:
-            self._keys = other._keys
+            self._adopt_keys(other._keys)
         elif self._keys != other._keys:
             raise ValueError('Keys in other QueryResult to not match, cannot extend')
-        self._result.extend(other._result)
+        if self._storage == STORAGE_ROWS:
+            self._result.extend(other._dicts())
+        elif self._storage == STORAGE_TUPLES:
+            self._result.extend(other.list())
+        else:
+            self._columns = [col + other_col for col, other_col in zip(self._columns, other._column_values())]
 
     def filter(self, predicate, inplace=False):
         """
@@ -399,9 +765,13 @@ class BaseResult(object):
             Returns:
                 QueryResult with filtered results
         """
-        filtered = [row for row in self._result if predicate(ResultRow(self._keys, row))]
+        if self._columns is None:
+            filtered = [row for row in self._result if predicate(ResultRow(self._keys, row))]
+        else:
+            keep = [bool(predicate(ResultRow(self._keys, self._row_at(ii)))) for ii in range(len(self))]
+            filtered = [tuple(compress(col, keep)) for col in self._columns]
         if inplace:
-            self._result = filtered
+            self._set_storage(filtered, self._storage)
             return None
         else:
-            return self._from_part(self._keys, filtered)
+            return self._from_part(self._keys, filtered, self._storage)
@@ -20,6 +20,7 @@ except (ImportError, AttributeError):
     from pathlib2 import Path
 
 Sniffer = csv.Sniffer
+CSVReader = csv.reader
 
 
 class DictReader(csv.DictReader):
@@ -1,17 +1,63 @@
 import mock
 import pytest
+import socket
+
+try:
+    import asyncio
+except ImportError:  # python 2, where the async tests are skipped
+    asyncio = None
 
 from google.cloud.bigquery.table import Row
 from sqlalchemy.engine import ResultProxy
 
+from spackl.db.bigquery import clear_clients
+
+
+class MockAsyncConnection(object):
+    """
+        Stands in for an async psycopg2 connection, polling through a real socket
+    """
+    def __init__(self, states):
+        self.sock, self.peer = socket.socketpair()
+        self.states = list(states)
+        self.polls = 0
+        self.cursor_obj = mock.Mock()
+        self.cancelled = False
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def poll(self):
+        self.polls += 1
+        state = self.states.pop(0)
+        if isinstance(state, Exception):
+            raise state
+        return state
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self.peer.close()
+
 
 class mock_engine:
     def __init__(self, url, **kwargs):
         self.url = str(url)
+        self.kwargs = kwargs
         self._execution_options = dict()
+        self.executed = list()
+        self.params = list()
 
     def execution_options(self, **kwargs):
         self._execution_options.update(**kwargs)
+        return self
 
     def connect(self):
         return self
@@ -20,16 +66,34 @@ class mock_engine:
         pass
 
     def execute(self, sql, **kwargs):
+        self.executed.append(str(sql))
+        self.params.append(kwargs)
+        rows = [{'first': 'a', 'second': 'b', 'third': 'c'},
+                {'first': 'd', 'second': 'e', 'third': 'f'},
+                {'first': 'g', 'second': 'h', 'third': 'i'}]
+        remaining = list(rows)
+
+        def fetchmany(size=None):
+            batch = remaining[:size]
+            del remaining[:size]
+            return batch
+
         result = mock.MagicMock(spec=ResultProxy)
-        result.__iter__.return_value = [{'first': 'a', 'second': 'b', 'third': 'c'},
-                                        {'first': 'd', 'second': 'e', 'third': 'f'},
-                                        {'first': 'g', 'second': 'h', 'third': 'i'}]
+        result.__iter__.return_value = rows
         result.keys.return_value = ['first', 'second', 'third']
+        result.fetchmany.side_effect = fetchmany
+        result.rowcount = len(rows)
         return result
 
     def begin(self):
         return self
 
+    def begin_nested(self):
+        return self
+
+    def in_transaction(self):
+        return False
+
     def __enter__(self):
         pass
 
@@ -37,6 +101,13 @@ class mock_engine:
         pass
 
 
+@pytest.fixture(autouse=True)
+def bigquery_clients():
+    clear_clients()
+    yield
+    clear_clients()
+
+
 @pytest.fixture()
 def mock_create_engine():
     def _create_engine(url, **kwargs):
@@ -52,3 +123,16 @@ def mock_bq_query_result():
         Row(['d', 'e', 'f'], {'first': 0, 'second': 1, 'third': 3}),
         Row(['g', 'h', 'i'], {'first': 0, 'second': 1, 'third': 3}),
     ]
+
+
+@pytest.fixture()
+def mock_async_connection():
+    return MockAsyncConnection
+
+
+@pytest.fixture()
+def loop():
+    pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
@@ -0,0 +1,57 @@
+import pytest
+
+from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+
+from spackl.db import aio
+from spackl.db.result import QueryResult
+
+
+def test_poll_connection(loop, mock_async_connection):
+    conn = mock_async_connection([POLL_WRITE, POLL_READ, POLL_OK])
+    conn.peer.send(b'x')
+    done = loop.create_future()
+    aio.poll_connection(loop, conn, lambda: done.set_result('ready'), done.set_exception)
+    assert loop.run_until_complete(done) == 'ready'
+    assert conn.polls == 3
+    conn.close()
+
+    conn = mock_async_connection([POLL_WRITE, ValueError('connection refused')])
+    done = loop.create_future()
+    aio.poll_connection(loop, conn, lambda: done.set_result('ready'), done.set_exception)
+    with pytest.raises(ValueError):
+        loop.run_until_complete(done)
+    conn.close()
+
+
+def test_then(loop):
+    result = loop.create_future()
+    aio.then(aio.run_in_executor(loop, lambda x: x + 1, 1), result.set_result, result)
+    assert loop.run_until_complete(result) == 2
+
+    result = loop.create_future()
+    aio.then(aio.run_in_executor(loop, lambda: 1 / 0), result.set_result, result)
+    with pytest.raises(ZeroDivisionError):
+        loop.run_until_complete(result)
+
+    def broken(value):
+        raise KeyError(value)
+
+    result = loop.create_future()
+    aio.then(aio.run_in_executor(loop, lambda: 'a'), broken, result)
+    with pytest.raises(KeyError):
+        loop.run_until_complete(result)
+
+
+def test_async_batches(loop):
+    batches = [QueryResult._from_values(['a'], [(1,), (2,)]), QueryResult._from_values(['a'], [(3,)])]
+    iterator = aio.AsyncBatches(lambda: iter(batches), loop=loop)
+    assert iterator.__aiter__() is iterator
+
+    seen = list()
+    while True:
+        try:
+            seen.append(loop.run_until_complete(iterator.__anext__()))
+        except StopAsyncIteration:  # noqa: F821 - only run on python 3
+            break
+    assert seen == batches
+    iterator.close()
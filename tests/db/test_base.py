@@ -1,12 +1,16 @@
 import mock
 import pytest
+import threading
+import time
 
-from spackl.db.base import BaseDb
+from spackl.db.base import BaseDb, SingleFlight
+from spackl.result import BaseResult
 
 
 def test_abc():
     with pytest.raises(TypeError):
         BaseDb()
+    assert BaseDb.__doc__.strip().startswith('Base class for database sources')
 
 
 def test_base_db():
@@ -53,3 +57,46 @@ def test_base_db():
 
     with pytest.raises(NotImplementedError):
         db._close()
+
+
+def test_single_flight():
+    flights = SingleFlight()
+    calls = list()
+    started = threading.Event()
+    release = threading.Event()
+    result = BaseResult(['a'], [('x',)], storage='tuples')
+
+    def run():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return result
+
+    seen = list()
+
+    def worker():
+        seen.append(flights.do('key', run))
+
+    leader = threading.Thread(target=worker)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # Give the followers time to find the flight
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(seen) == 4
+    assert all(r == result for r in seen)
+    # Followers get copies, so one caller changing its result doesn't change another's
+    assert len(set(id(r) for r in seen)) == 4
+    assert len(flights) == 0
+
+    assert flights.do('key', lambda: result) is result
+    with pytest.raises(ValueError):
+        flights.do('key', mock.Mock(side_effect=ValueError('failed')))
+    assert len(flights) == 0
@@ -1,10 +1,27 @@
+import datetime
+import io
+import json
 import mock
 import os
+import pytest
+import time
 
+try:
+    import asyncio
+except ImportError:  # python 2, where the async tests are skipped
+    asyncio = None
+
+from collections import OrderedDict
+from decimal import Decimal
+
+from google.cloud.bigquery import SchemaField
+from google.cloud.bigquery import client as bigquery_client
 from google.cloud.bigquery.table import Row, RowIterator
 
+from spackl.db import LazyQueryResult
 from spackl.db.base import BaseDb
-from spackl.db.bigquery import BigQuery, BIGQUERY_DEFAULT_CONN_KWARGS
+from spackl.db.bigquery import BigQuery, BIGQUERY_DEFAULT_CONN_KWARGS, TABLE_METADATA_KEYS
+from spackl.file import FileResult
 from spackl.util import Path
 
 uname = os.uname()[1]
@@ -115,68 +132,68 @@ def test_connection():
 
 
 def test_connection_with_env():
-    try:
-        del os.environ['GOOGLE_APPLICATION_CREDENTIALS']
-    except KeyError:
-        pass
-
     with mock.patch.dict('spackl.db.bigquery.os.environ', {'BIGQUERY_CREDS_FILE': test_creds_path}):
         bq = BigQuery()
 
     assert bq._conn is None
     assert bq.connected is False
 
+    creds = object()
     with mock.patch('spackl.db.bigquery.Client', MockBigQueryClient):
-        bq.connect()
-        bq._conn.set_creds_var()
+        with mock.patch('google.auth.load_credentials_from_file', return_value=(creds, 'creds-project')) as load:
+            bq.connect()
 
-    assert bq._conn
+    load.assert_called_once_with(test_creds_path)
     assert bq.connected is True
-    assert bq._conn.creds_var == test_creds_path
+    assert bq._conn.credentials is creds
+    assert bq._conn.project == 'creds-project'
+    assert 'GOOGLE_APPLICATION_CREDENTIALS' not in os.environ
 
 
 def test_connection_with_bad_env():
-    try:
-        del os.environ['GOOGLE_APPLICATION_CREDENTIALS']
-    except KeyError:
-        pass
-
     with mock.patch.dict(
             'spackl.db.bigquery.os.environ', {'BIGQUERY_CREDS_FILE': test_creds_not_exist_path}):
         bq = BigQuery()
 
-    assert bq._conn is None
-    assert bq.connected is False
-
     with mock.patch('spackl.db.bigquery.Client', MockBigQueryClient):
-        bq.connect()
-        bq._conn.set_creds_var()
+        with mock.patch('google.auth.load_credentials_from_file') as load:
+            bq.connect()
 
-    assert bq._conn
+    assert not load.called
     assert bq.connected is True
-    assert bq._conn.creds_var is None
+    assert bq._conn.credentials is None
 
 
 def test_connection_with_passed():
-    try:
-        del os.environ['GOOGLE_APPLICATION_CREDENTIALS']
-    except KeyError:
-        pass
-
-    bq = BigQuery(creds_file=test_creds_path)
+    bq = BigQuery(creds_file=test_creds_path, project=project)
     assert bq._bq_creds_file == test_creds_path
-    assert bq._conn_kwargs == BIGQUERY_DEFAULT_CONN_KWARGS
-
     assert bq._conn is None
-    assert bq.connected is False
 
+    creds = object()
     with mock.patch('spackl.db.bigquery.Client', MockBigQueryClient):
-        bq.connect()
-        bq._conn.set_creds_var()
+        with mock.patch('google.auth.load_credentials_from_file', return_value=(creds, 'creds-project')):
+            bq.connect()
 
-    assert bq._conn
-    assert bq.connected is True
-    assert bq._conn.creds_var == test_creds_path
+    assert bq._conn.credentials is creds
+    assert bq._conn.project == project
+
+
+def test_shared_clients():
+    with mock.patch('spackl.db.bigquery.Client', MockBigQueryClient):
+        with mock.patch('google.auth.load_credentials_from_file', return_value=(object(), None)) as load:
+            clients = [BigQuery(creds_file=test_creds_path, project=project) for _ in range(3)]
+            for bq in clients:
+                bq.connect()
+            other = BigQuery(creds_file=test_creds_path, project=project, location='EU')
+            other.connect()
+
+    assert clients[0]._conn is clients[1]._conn is clients[2]._conn
+    assert other._conn is not clients[0]._conn
+    assert other._conn.location == 'EU'
+    assert load.call_count == 2
+
+    clients[0].close()
+    assert clients[1]._conn is clients[2]._conn
 
 
 def test_query_without_connection():
@@ -200,6 +217,16 @@ def test_query_vs_execute():
     assert res is None
 
 
+def test_query_lazy():
+    bq = BigQuery()
+
+    with mock.patch('spackl.db.bigquery.Client', MockBigQueryClient):
+        results = bq.query(query, lazy=True)
+    assert isinstance(results, LazyQueryResult)
+    assert [row.first for row in results] == ['a', 'd', 'g']
+    assert results.result == expected_query_results
+
+
 def test_list_tables():
     bq = BigQuery()
 
@@ -231,3 +258,277 @@ def test_delete_table():
     with mock.patch('spackl.db.bigquery.Client', MockBigQueryClient):
         bq1.delete_table('my_dataset', 'my_table')
     assert bq1.connected is True
+
+
+def test_query_async(loop):
+    bq = BigQuery()
+    client = MockBigQueryClient()
+    client.done = mock.Mock(side_effect=[False, False, True])
+    client.cancel = mock.Mock()
+    with mock.patch('spackl.db.bigquery.Client', return_value=client):
+        result = loop.run_until_complete(bq.query_async(query, loop=loop, poll_interval=0))
+    assert result.result == expected_query_results
+    assert client.done.call_count == 3
+
+    client.done = mock.Mock(return_value=True)
+    assert loop.run_until_complete(bq.execute_async(query, loop=loop)) is None
+
+    client.done = mock.Mock(return_value=False)
+    future = bq.query_async(query, loop=loop, poll_interval=0.01)
+    loop.run_until_complete(asyncio.sleep(0.05))
+    future.cancel()
+    loop.run_until_complete(asyncio.sleep(0.05))
+    client.cancel.assert_called_once_with()
+
+    client.done = mock.Mock(side_effect=RuntimeError('job failed'))
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(bq.query_async(query, loop=loop))
+
+
+def test_query_parallel():
+    bq = BigQuery()
+    schema = [SchemaField('first', 'STRING'), SchemaField('second', 'STRING'), SchemaField('third', 'STRING')]
+    data = [['a', 'b', 'c'], ['d', 'e', 'f'], ['g', 'h', 'i'], ['j', 'k', 'l'], ['m', 'n', 'o']]
+    calls = list()
+
+    def list_rows(table, selected_fields=None, start_index=None, max_results=None, page_size=None):
+        calls.append((start_index, max_results, page_size))
+        names = [f.name for f in selected_fields]
+        positions = [[f.name for f in schema].index(n) for n in names]
+        result = mock.MagicMock(spec=RowIterator)
+        result.__iter__.return_value = [
+            Row([row[p] for p in positions], dict((n, i) for i, n in enumerate(names)))
+            for row in data[start_index:start_index + max_results]]
+        return result
+
+    client = mock.Mock()
+    # The iterator's total_rows is None until a page is read, as on google-cloud-bigquery 1.5
+    client.query.return_value.result.return_value.total_rows = None
+    client.get_table.return_value.num_rows = len(data)
+    client.get_table.return_value.schema = schema
+    client.list_rows.side_effect = list_rows
+    with mock.patch('spackl.db.bigquery.Client', return_value=client):
+        result = bq.query_parallel(query, readers=2, page_size=2)
+    assert sorted(calls) == [(0, 2, 2), (2, 2, 2), (4, 1, 2)]
+    assert result.list() == [tuple(row) for row in data]
+    assert list(result._keys) == ['first', 'second', 'third']
+
+    del calls[:]
+    pages = list()
+    stats = bq.query_parallel(query, readers=2, page_size=2, max_results=4, selected_fields=['third', 'first'],
+                              sink=pages.append)
+    assert stats == {'rows': 4, 'pages': 2}
+    assert [page.result for page in pages] == [[{'third': 'c', 'first': 'a'}, {'third': 'f', 'first': 'd'}],
+                                               [{'third': 'i', 'first': 'g'}, {'third': 'l', 'first': 'j'}]]
+
+    with pytest.raises(ValueError):
+        bq.query_parallel(query, selected_fields=['missing'])
+
+    client.get_table.return_value.num_rows = 0
+    result = bq.query_parallel(query)
+    assert len(result) == 0
+    assert list(result._keys) == ['first', 'second', 'third']
+
+
+def test_query_jobs():
+    bq = BigQuery()
+
+    def make_job(polls, rows=None, error=None):
+        job = mock.Mock()
+        job.done.side_effect = [False] * polls + [True] * 10
+        result = mock.MagicMock(spec=RowIterator)
+        result.__iter__.return_value = [Row(row, {'value': 0}) for row in rows or []]
+        job.result.side_effect = error or [result]
+        return job
+
+    jobs = dict()
+
+    def submit(sql):
+        return jobs[sql]
+
+    client = mock.Mock()
+    client.query.side_effect = submit
+    with mock.patch('spackl.db.bigquery.Client', return_value=client):
+        bq.connect()
+
+    jobs.update(slow=make_job(2, [['s']]), fast=make_job(0, [['f']]), middle=make_job(1, [['m']]))
+    results = list(bq.query_jobs((sql for sql in ['slow', 'fast', 'middle']), poll_interval=0))
+    assert [(key, r.result) for key, r in results] == [
+        (1, [{'value': 'f'}]), (2, [{'value': 'm'}]), (0, [{'value': 's'}])]
+
+    jobs.update(slow=make_job(4, [['s']]), fast=make_job(0, [['f']]), middle=make_job(1, [['m']]))
+    with mock.patch('spackl.db.bigquery.time.sleep') as sleep:
+        results = list(bq.query_jobs(OrderedDict([('a', 'slow'), ('b', 'fast'), ('c', 'middle')]), ordered=True,
+                                     poll_interval=1, max_poll_interval=1.5))
+    assert [key for key, _ in results] == ['a', 'b', 'c']
+    assert [c[0][0] for c in sleep.call_args_list] == [1, 1.5]
+
+    error = RuntimeError('job failed')
+    jobs.update(bad=make_job(0, error=error), good=make_job(0, [['g']]), stuck=make_job(100))
+    results = list(bq.query_jobs(['bad', 'good'], poll_interval=0, return_exceptions=True))
+    assert results[0] == (0, error)
+    with pytest.raises(RuntimeError):
+        list(bq.query_jobs(['stuck', 'bad'], poll_interval=0))
+    jobs['stuck'].cancel.assert_called_once_with()
+
+
+class MockLoadClient(MockBigQueryClient):
+    def __init__(self, **kwargs):
+        super(MockLoadClient, self).__init__(**kwargs)
+        self.loads = list()
+
+    def table(self, table_id):
+        return '{}.{}'.format(self._dataset, table_id)
+
+    def load_table_from_file(self, file_obj, destination, rewind=False, size=None, job_config=None):
+        # The real client refuses streams not opened for reading bytes
+        bigquery_client._check_mode(file_obj)
+        if rewind:
+            file_obj.seek(0)
+        data = file_obj.read()
+        assert size is None or size == len(data)
+        self.loads.append((destination, data, job_config))
+        return mock.Mock()
+
+
+def test_load():
+    bq = BigQuery()
+    with mock.patch('spackl.db.bigquery.Client', MockLoadClient):
+        bq.connect()
+
+    result = FileResult([OrderedDict([('id', 1), ('amount', Decimal('1.10')), ('day', datetime.date(2020, 1, 2))]),
+                         OrderedDict([('id', 2), ('amount', None), ('day', datetime.date(2020, 1, 3))]),
+                         OrderedDict([('id', 3), ('amount', Decimal('3')), ('day', None)])])
+    bq._metadata[('describe', 'my_dataset', ('my_table',))] = (time.time() + 60, list())
+    stats = bq.load('my_dataset', 'my_table', result, columns=['a', 'b', 'c'], write_disposition='WRITE_TRUNCATE')
+    assert bq._metadata == dict()
+
+    (destination, data, config), = bq._conn.loads
+    assert destination == 'my_dataset.my_table'
+    assert [json.loads(line) for line in data.decode('utf-8').splitlines()] == [
+        {'a': 1, 'b': '1.10', 'c': '2020-01-02'}, {'a': 2, 'b': None, 'c': '2020-01-03'},
+        {'a': 3, 'b': '3', 'c': None}]
+    assert config.source_format == 'NEWLINE_DELIMITED_JSON'
+    assert config.write_disposition == 'WRITE_TRUNCATE'
+    assert config.autodetect is True
+    assert stats == {'rows': 3, 'bytes': len(data), 'jobs': 1}
+
+    bq._conn.loads = list()
+    schema = [SchemaField('id', 'INTEGER'), SchemaField('amount', 'NUMERIC'), SchemaField('day', 'DATE')]
+    stats = bq.load('my_dataset', 'my_table', result, schema=schema, write_disposition='WRITE_TRUNCATE',
+                    chunk_bytes=1, batch_size=2)
+    assert stats['rows'] == 3
+    assert stats['jobs'] == 2
+    assert [len(data.splitlines()) for _, data, _ in bq._conn.loads] == [2, 1]
+    assert [config.write_disposition for _, _, config in bq._conn.loads] == ['WRITE_TRUNCATE', 'WRITE_APPEND']
+    assert bq._conn.loads[0][2].schema == schema
+    assert not bq._conn.loads[0][2].autodetect
+
+    bq._conn.loads = list()
+    assert bq.load('my_dataset', 'my_table', result[3:]) == {'rows': 0, 'bytes': 0, 'jobs': 0}
+    assert bq._conn.loads == []
+
+    with pytest.raises(ValueError):
+        bq.load('my_dataset', 'my_table', result, format='parquet')
+    with pytest.raises(ValueError):
+        bq.load('my_dataset', 'my_table', result, columns=['a'])
+    with mock.patch('spackl.db.bigquery.fastavro', None):
+        with pytest.raises(ImportError):
+            bq.load('my_dataset', 'my_table', result, format='avro')
+    with mock.patch('spackl.db.bigquery.fastavro'):
+        with mock.patch('google.cloud.bigquery.LoadJobConfig', mock.Mock(spec=[])):
+            with pytest.raises(RuntimeError):
+                bq.load('my_dataset', 'my_table', result, format='avro')
+    assert bq._conn.loads == []
+
+
+def test_load_avro():
+    fastavro = pytest.importorskip('fastavro')
+    bq = BigQuery()
+    with mock.patch('spackl.db.bigquery.Client', MockLoadClient):
+        bq.connect()
+
+    result = FileResult([OrderedDict([('id', 1), ('name', None), ('ok', True)]),
+                         OrderedDict([('id', 2), ('name', 'two'), ('ok', False)])])
+    stats = bq.load('my_dataset', 'my_table', result, format='avro')
+
+    (_, data, config), = bq._conn.loads
+    assert config.source_format == 'AVRO'
+    assert list(fastavro.reader(io.BytesIO(data))) == [{'id': 1, 'name': None, 'ok': True},
+                                                       {'id': 2, 'name': 'two', 'ok': False}]
+    assert stats['rows'] == 2
+
+
+def test_table_admin():
+    from google.api_core.exceptions import Forbidden, NotFound
+    from google.cloud.bigquery import DatasetReference
+
+    now = datetime.datetime(2020, 1, 2, 3, 4, 5)
+    tables = dict((t, mock.Mock(table_id=t, table_type='TABLE', num_rows=i, num_bytes=i * 10,
+                                created=now, modified=now, expires=None))
+                  for i, t in enumerate(['a', 'b', 'c']))
+
+    def get_table(ref):
+        if ref.table_id == 'c':
+            raise NotFound('gone')
+        return tables[ref.table_id]
+
+    def delete_table(ref):
+        if ref.table_id == 'b':
+            raise Forbidden('not yours')
+        if ref.table_id == 'c':
+            raise NotFound('gone')
+
+    client = mock.Mock()
+    client.dataset.side_effect = lambda dataset_id: DatasetReference('my-project', dataset_id)
+    client.list_tables.return_value = list(tables.values())
+    client.get_table.side_effect = get_table
+    client.delete_table.side_effect = delete_table
+
+    bq = BigQuery(metadata_ttl=60)
+    with mock.patch('spackl.db.bigquery.Client', return_value=client):
+        bq.connect()
+
+    described = bq.describe_tables('my_dataset', max_workers=2)
+    assert list(described._keys) == TABLE_METADATA_KEYS
+    assert sorted(described.list()) == [('a', 'TABLE', 0, 0, now, now, None), ('b', 'TABLE', 1, 10, now, now, None)]
+    assert bq.list_tables('my_dataset') == ['a', 'b', 'c']
+    bq.describe_tables('my_dataset')
+    assert client.list_tables.call_count == 3
+    assert client.get_table.call_count == 3
+
+    # A table created through the same instance shows up straight away
+    client.list_tables.return_value = list(tables.values()) + [mock.Mock(table_id='d')]
+    tables['d'] = mock.Mock(table_id='d', table_type='TABLE', num_rows=0, num_bytes=0,
+                            created=now, modified=now, expires=None)
+    with mock.patch.object(bq, '_query'):
+        bq.execute('CREATE TABLE my_dataset.d (x INT64)')
+    assert bq.list_tables('my_dataset') == ['a', 'b', 'c', 'd']
+    assert 'd' in [row[0] for row in bq.describe_tables('my_dataset', table_ids=['a', 'b', 'd']).list()]
+    assert client.get_table.call_count == 6
+    bq.describe_tables('my_dataset', table_ids=['a', 'b', 'd'])
+    assert client.get_table.call_count == 6
+    bq._forget_metadata()
+
+    bq.describe_tables('my_dataset', table_ids=['a'])
+    errors = bq.delete_tables('my_dataset', ['a', 'b', 'c'], not_found_ok=True)
+    assert list(errors) == ['b']
+    assert isinstance(errors['b'], Forbidden)
+    assert client.delete_table.call_count == 3
+    assert bq._metadata == dict()
+    with pytest.raises(Forbidden):
+        bq.delete_table('my_dataset', 'b')
+    with pytest.raises(NotFound):
+        bq.delete_table('my_dataset', 'c')
+    assert list(bq.delete_tables('my_dataset', ['c'])) == ['c']
+
+    expires = datetime.datetime(2030, 1, 1)
+    assert bq.expire_tables('my_dataset', ['a', 'b'], expires) == dict()
+    updated = sorted((c[0] for c in client.update_table.call_args_list), key=lambda args: args[0].table_id)
+    assert [(t.table_id, t.expires.replace(tzinfo=None), fields) for t, fields in updated] == [
+        ('a', expires, ['expires']), ('b', expires, ['expires'])]
+
+    client.update_table.reset_mock()
+    bq.expire_tables('my_dataset', ['a'], datetime.timedelta(days=1))
+    (table, _), _ = client.update_table.call_args
+    assert table.expires.replace(tzinfo=None) > datetime.datetime.utcnow()
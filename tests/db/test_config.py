@@ -1,8 +1,10 @@
 import mock
 import pytest
 import os
+import threading
 
 import spackl.db
+from spackl.db.result import QueryResult
 from spackl.util import Path
 
 
@@ -111,3 +113,82 @@ def test_bad_yaml():
 
     nolist_conf = spackl.db.config.Config(test_nolist_config_path)
     assert nolist_conf.dbs == expected_nolist_db_list
+
+
+def test_get_db():
+    conf = spackl.db.config.Config(test_config_path)
+
+    pg = conf.get_db('default')
+    assert isinstance(pg, spackl.db.Postgres)
+    assert pg.name == 'default'
+    assert pg._conn_kwargs['database'] == 'mydb'
+    assert conf.get_db('default') is pg
+
+    bq = conf.get_db('default_1')
+    assert isinstance(bq, spackl.db.BigQuery)
+    assert bq.project == 'ohnoitsadupe!'
+
+    conf._named['default_2']['type'] = 'redshift'
+    assert isinstance(conf.get_db('default_2'), spackl.db.Redshift)
+
+    with pytest.raises(KeyError):
+        conf.get_db('nope')
+    conf._named['th1s_is_annoy_ing_butwecan_figureit_out']['type'] = 'oracle'
+    with pytest.raises(ValueError):
+        conf.get_db('th1s_is_annoy_ing_butwecan_figureit_out')
+
+
+def test_fan_out():
+    conf = spackl.db.config.Config(test_config_path)
+    release = threading.Event()
+
+    def slow(query_string, **kwargs):
+        release.wait()
+        return 'slow result'
+
+    conf._clients = {
+        'default': mock.Mock(query=mock.Mock(return_value='a result')),
+        'default_1': mock.Mock(query=mock.Mock(side_effect=ValueError('no such table'))),
+        'default_2': mock.Mock(query=mock.Mock(side_effect=slow)),
+    }
+    queries = {'default': 'select 1', 'default_1': 'select 2', 'default_2': 'select 3'}
+    try:
+        outcome = conf.fan_out(queries, max_workers=2, timeout=0.2, storage='tuples')
+    finally:
+        release.set()
+
+    assert outcome.results == {'default': 'a result'}
+    assert isinstance(outcome.errors['default_1'], ValueError)
+    assert isinstance(outcome.errors['default_2'], spackl.db.config.TimeoutError)
+    assert sorted(outcome.timings) == sorted(queries)
+    assert outcome.timings['default_2'] >= 0.2
+    assert outcome.ok is False
+    conf._clients['default'].query.assert_called_once_with('select 1', storage='tuples')
+
+    outcome = conf.fan_out({'default': 'select 1'})
+    assert outcome.ok is True
+
+    with pytest.raises(KeyError):
+        conf.fan_out({'nope': 'select 1'})
+
+
+def test_query_shards():
+    conf = spackl.db.config.Config(test_config_path)
+    conf._clients = {
+        'default': mock.Mock(query=mock.Mock(
+            return_value=QueryResult._from_values(['id'], [(1,), (3,)], 'tuples'))),
+        'default_1': mock.Mock(query=mock.Mock(
+            return_value=QueryResult._from_values(['id'], [(2,), (4,)], 'tuples'))),
+    }
+
+    result = conf.query_shards(['default', 'default_1'], 'select id from t', order_by='id', limit=3)
+    assert result.list() == [(1,), (2,), (3,)]
+    conf._clients['default'].query.assert_called_once_with(
+        'SELECT * FROM (select id from t) AS _spackl_shard ORDER BY "id" LIMIT 3', storage='tuples')
+
+    result = conf.query_shards(['default_1', 'default'], 'select id from t')
+    assert result.list() == [(2,), (4,), (1,), (3,)]
+
+    conf._clients['default_1'].query.side_effect = ValueError('shard down')
+    with pytest.raises(ValueError):
+        conf.query_shards(['default', 'default_1'], 'select id from t')
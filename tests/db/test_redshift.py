@@ -1,8 +1,12 @@
 import mock
 import os
+import pytest
+
+from collections import OrderedDict
 
 from spackl.db.base import BaseDb
 from spackl.db import Postgres, Redshift
+from spackl.file import FileResult
 
 uname = os.uname()[1]
 expected_db_type = 'redshift+psycopg2'
@@ -63,3 +67,110 @@ def test_connection(mock_create_engine):
     rs.close()
     assert not rs._conn
     assert rs.connected is False
+
+
+def test_iter_batches(mock_create_engine):
+    with mock.patch('spackl.db.postgres.sqlalchemy.create_engine', mock_create_engine):
+        rs = Redshift(stream_results=True, batch_size=2)
+    assert rs._engine._execution_options == dict()
+
+    batches = list(rs.iter_batches(query))
+    assert rs._engine._execution_options == {'stream_results': True, 'max_row_buffer': 2}
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert batches[1].result == expected_query_results[2:]
+
+
+class MockInsertCursor(object):
+    def __init__(self):
+        self.executed = list()
+        self.closed = False
+
+    def mogrify(self, sql, values):
+        return (sql % tuple("'{}'".format(v) for v in values)).encode('utf-8')
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def close(self):
+        self.closed = True
+
+
+def test_merge(mock_create_engine):
+    with mock.patch('spackl.db.postgres.sqlalchemy.create_engine', mock_create_engine):
+        rs = Redshift()
+
+    cursor = MockInsertCursor()
+    rs._engine.connection = mock.Mock(cursor=lambda: cursor)
+
+    result = FileResult([OrderedDict([('id', '1'), ('name', 'one')]),
+                         OrderedDict([('id', '2'), ('name', 'two')]),
+                         OrderedDict([('id', '3'), ('name', 'three')])])
+    stats = rs.merge('my_table', result, ['id'], batch_size=2)
+
+    create, delete, insert, drop = rs._engine.executed
+    staging = create.split()[3]
+    assert create == 'CREATE TEMP TABLE {} (LIKE my_table)'.format(staging)
+    assert cursor.executed == [
+        'INSERT INTO {} ("id", "name") VALUES (\'1\', \'one\'), (\'2\', \'two\'), (\'3\', \'three\')'
+        .format(staging).encode('utf-8')]
+    assert cursor.closed is True
+    assert delete == 'DELETE FROM my_table USING {0} WHERE my_table."id" = {0}."id"'.format(staging)
+    assert insert == 'INSERT INTO my_table ("id", "name") SELECT "id", "name" FROM {}'.format(staging)
+    assert drop == 'DROP TABLE {}'.format(staging)
+    assert stats['rows'] == 3
+    assert stats['merged'] == 3
+
+
+def test_insert(mock_create_engine):
+    with mock.patch('spackl.db.postgres.sqlalchemy.create_engine', mock_create_engine):
+        rs = Redshift()
+
+    cursor = MockInsertCursor()
+    rs._engine.connection = mock.Mock(cursor=lambda: cursor)
+
+    result = FileResult([OrderedDict([('id', str(i))]) for i in range(5)])
+    prefix = b'INSERT INTO my_table ("id") VALUES '
+    # Room for exactly two "('n')" values and their separator
+    stats = rs.insert('my_table', result, max_statement_bytes=len(prefix) + 12, batch_size=3)
+
+    assert cursor.executed == [prefix + b"('0'), ('1')", prefix + b"('2'), ('3')", prefix + b"('4')"]
+    assert cursor.closed is True
+    assert stats == {'rows': 5, 'bytes': sum(len(s) for s in cursor.executed), 'statements': 3}
+
+    cursor = MockInsertCursor()
+    rs._engine.connection = mock.Mock(cursor=lambda: cursor)
+    stats = rs.insert('my_table', rs.query(query, lazy=True), columns=['a', 'b', 'c'])
+    assert cursor.executed == [b'INSERT INTO my_table ("a", "b", "c") VALUES '
+                               b"('a', 'b', 'c'), ('d', 'e', 'f'), ('g', 'h', 'i')"]
+    assert stats['statements'] == 1
+
+    with pytest.raises(ValueError):
+        rs.insert('my_table', result, max_statement_bytes=len(prefix) + 2)
+    with pytest.raises(ValueError):
+        rs.insert('my_table', result, columns=['a', 'b'])
+
+
+def test_insert_events(mock_create_engine):
+    with mock.patch('spackl.db.postgres.sqlalchemy.create_engine', mock_create_engine):
+        rs = Redshift(name='rs')
+
+    cursor = MockInsertCursor()
+    rs._engine.connection = mock.Mock(cursor=lambda: cursor)
+    events = list()
+    rs.add_listener(events.append)
+
+    result = FileResult([OrderedDict([('id', str(i))]) for i in range(3)])
+    prefix = b'INSERT INTO my_table ("id") VALUES '
+    rs.insert('my_table', result, max_statement_bytes=len(prefix) + 12)
+
+    assert len(events) == 2
+    for event, sql, rows in zip(events, cursor.executed, [2, 1]):
+        assert event.source == 'Redshift'
+        assert event.name == 'rs'
+        assert event.operation == 'insert'
+        assert event.query == 'INSERT INTO my_table ("id") VALUES ...'
+        assert list(event.phases) == ['execute']
+        assert event.duration >= event.phases['execute']
+        assert event.rows == rows
+        assert event.bytes == len(sql)
+        assert event.error is None
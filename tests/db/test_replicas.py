@@ -0,0 +1,84 @@
+import mock
+import pytest
+import sqlalchemy
+
+from spackl.db.replicas import (
+    LatencyWeighted,
+    LeastOutstanding,
+    Replica,
+    ReplicaSet,
+    RoundRobin,
+    get_balancer)
+
+
+def make_replicas(*names):
+    return [Replica(name, mock.Mock(name=name)) for name in names]
+
+
+def test_balancers():
+    a, b, c = make_replicas('a', 'b', 'c')
+    robin = RoundRobin()
+    assert [robin.choose([a, b, c]) for _ in range(4)] == [a, b, c, a]
+
+    b.outstanding = 2
+    a.outstanding = 1
+    assert LeastOutstanding().choose([a, b, c]) is c
+
+    latency = LatencyWeighted()
+    a.latency, b.latency = 0.01, 100
+    assert latency.choose([a, b, c]) is c
+    c.latency = 100
+    picks = [latency.choose([a, b, c]) for _ in range(100)]
+    assert picks.count(a) > 90
+
+    assert isinstance(get_balancer('least_outstanding'), LeastOutstanding)
+    assert get_balancer(robin) is robin
+    with pytest.raises(ValueError):
+        get_balancer('random')
+    with pytest.raises(TypeError):
+        get_balancer(object())
+
+
+def test_ejection():
+    a, b = make_replicas('a', 'b')
+    a.engine.connect.side_effect = sqlalchemy.exc.OperationalError('connect', {}, Exception('refused'))
+    replicas = ReplicaSet([a, b], eject_after=2, eject_seconds=60)
+    fallback = mock.Mock()
+
+    # a fails to connect, so b is used instead
+    assert replicas.checkout(fallback) == (b, b.engine.connect.return_value)
+    assert a.failures == 1
+    replicas.checkout(fallback)
+    assert replicas.healthy() == [b]
+
+    b.engine.connect.side_effect = ValueError('refused')
+    for _ in range(2):
+        assert replicas.checkout(fallback) == (None, fallback.connect.return_value)
+    assert replicas.healthy() == []
+
+    with mock.patch('spackl.db.replicas.time.time', return_value=2 ** 40):
+        assert len(replicas.healthy()) == 2
+
+
+def test_connection():
+    a, = make_replicas('a')
+    conn = a.engine.connect.return_value
+    replicas = ReplicaSet([a], eject_after=1)
+
+    with replicas.connection(mock.Mock()) as used:
+        assert used is conn
+        assert a.outstanding == 1
+    assert a.outstanding == 0
+    assert a.latency is not None
+    conn.close.assert_called_once_with()
+
+    with pytest.raises(sqlalchemy.exc.ProgrammingError):
+        with replicas.connection(mock.Mock()):
+            raise sqlalchemy.exc.ProgrammingError('select nope', {}, Exception('no such column'))
+    assert replicas.healthy() == [a]
+
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        with replicas.connection(mock.Mock()):
+            raise sqlalchemy.exc.OperationalError('select 1', {}, Exception('server closed the connection'))
+    assert replicas.healthy() == []
+    assert a.outstanding == 0
@@ -9,7 +9,7 @@ from google.cloud.bigquery.table import RowIterator
 from sqlalchemy.engine import ResultProxy
 
 from spackl.result import ResultRow, ResultCol
-from spackl.db.result import QueryResult
+from spackl.db.result import LazyQueryResult, QueryResult
 
 results = [OrderedDict([('a', 1), ('b', decimal.Decimal(2.0)), ('c', datetime.date(2018, 8, 1))]),
            OrderedDict([('a', 4), ('b', decimal.Decimal(5.0)), ('c', datetime.date(2018, 9, 1))]),
@@ -59,3 +59,139 @@ def test_queryresult():
     expected_keys = ['a', 'b', 'c']
     for i, k in enumerate(qr.keys()):
         assert k == expected_keys[i]
+
+
+def test_queryresult_columns():
+    itr = get_mock_iterator(RowIterator, malformed_results)
+    with pytest.raises(AttributeError):
+        QueryResult(itr, storage='columns')
+
+    itr = get_mock_iterator(ResultProxy, list())
+    qr = QueryResult(itr, storage='columns')
+    assert bool(qr) is False
+    assert qr.empty is True
+
+    itr = get_mock_iterator(ResultProxy, results)
+    qr = QueryResult(itr, storage='columns')
+
+    assert qr.storage == 'columns'
+    assert qr._result is None
+    assert len(qr) == 3
+    assert qr.a == ResultCol('a', (1, 4, 7))
+    assert qr[1].b == decimal.Decimal(5.0)
+    assert qr.result == results
+    assert isinstance(qr[1:], QueryResult)
+    assert qr[1:].a == ResultCol('a', (4, 7))
+
+
+def test_queryresult_tuples():
+    itr = get_mock_iterator(ResultProxy, results)
+    qr = QueryResult(itr, storage='tuples')
+
+    assert qr.storage == 'tuples'
+    assert qr._result[2] == (7, decimal.Decimal(8.0), datetime.datetime(2018, 10, 1))
+    assert qr[2].c == datetime.datetime(2018, 10, 1)
+    assert qr.a == ResultCol('a', (1, 4, 7))
+    assert qr.result == results
+
+
+class CountingIterator(object):
+    """Hands out rows one at a time, counting how many have been pulled"""
+    def __init__(self, values):
+        self.values = list(values)
+        self.pulled = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pulled >= len(self.values):
+            raise StopIteration
+        self.pulled += 1
+        return self.values[self.pulled - 1]
+
+    next = __next__
+
+
+def get_lazy_iterator(spec, values):
+    source = CountingIterator(values)
+    mock_result = mock.MagicMock(spec=spec)
+    mock_result.__iter__.return_value = source
+    return mock_result, source
+
+
+def test_lazyqueryresult():
+    with pytest.raises(TypeError):
+        LazyQueryResult('nope')
+    with pytest.raises(ValueError):
+        LazyQueryResult(get_mock_iterator(ResultProxy, results), storage='sideways')
+
+    on_close = mock.Mock()
+    itr, source = get_lazy_iterator(ResultProxy, results)
+    qr = LazyQueryResult(itr, on_close=on_close)
+
+    assert source.pulled == 1
+    assert qr.pending is True
+    assert bool(qr) is True
+    assert list(qr.keys()) == ['a', 'b', 'c']
+
+    for row in qr:
+        assert row.a == 1
+        break
+    assert source.pulled == 1
+    on_close.assert_not_called()
+
+    assert len(qr) == 3
+    assert source.pulled == 3
+    assert qr.pending is False
+    on_close.assert_called_once_with()
+    assert qr.result == results
+    assert [row.a for row in qr] == [1, 4, 7]
+    assert type(qr[1:]) is QueryResult
+    assert qr[1:].a == ResultCol('a', (4, 7))
+    assert [len(batch) for batch in qr.iter_batches(2)] == [2, 1]
+
+    itr, source = get_lazy_iterator(RowIterator, results)
+    qr = LazyQueryResult(itr, storage='columns')
+    assert [row.b for row in qr] == [decimal.Decimal(2.0), decimal.Decimal(5.0), decimal.Decimal(8.0)]
+    assert qr.pending is True
+    assert qr.a == ResultCol('a', (1, 4, 7))
+    assert qr._columns[2][2] == datetime.datetime(2018, 10, 1)
+
+    qr = LazyQueryResult(get_mock_iterator(ResultProxy, list()), on_close=on_close)
+    assert bool(qr) is False
+    assert len(qr) == 0
+    assert qr.empty is True
+
+    itr = get_mock_iterator(ResultProxy, malformed_results)
+    with pytest.raises(AttributeError):
+        LazyQueryResult(itr).fetch()
+
+
+def test_lazyqueryresult_batches():
+    on_close = mock.Mock()
+    itr, source = get_lazy_iterator(ResultProxy, results * 3)
+    qr = LazyQueryResult(itr, storage='tuples', on_close=on_close)
+
+    with pytest.raises(ValueError):
+        next(qr.iter_batches(0))
+
+    batches = qr.iter_batches(batch_size=4)
+    first = next(batches)
+    assert type(first) is QueryResult
+    assert first.storage == 'tuples'
+    assert first.a == ResultCol('a', (1, 4, 7, 1))
+    assert source.pulled == 4
+    assert [len(batch) for batch in batches] == [4, 1]
+    on_close.assert_called_once_with()
+
+    with pytest.raises(RuntimeError):
+        len(qr)
+
+    itr, source = get_lazy_iterator(ResultProxy, results)
+    qr = LazyQueryResult(itr, on_close=on_close)
+    qr.close()
+    assert source.pulled == 1
+    assert on_close.call_count == 2
+    with pytest.raises(RuntimeError):
+        qr.list()
@@ -0,0 +1,44 @@
+import pytest
+
+from spackl.db.result import QueryResult
+from spackl.db.shards import merge_results, shard_query
+
+query = 'select * from events;'
+
+
+def make_result(rows, keys=('id', 'name')):
+    return QueryResult._from_values(list(keys), rows, 'tuples')
+
+
+def test_shard_query():
+    assert shard_query(query) == query
+    assert shard_query(query, limit=10) == 'SELECT * FROM (select * from events) AS _spackl_shard LIMIT 10'
+    assert shard_query(query, order_by=['id', 'name'], descending=True) == (
+        'SELECT * FROM (select * from events) AS _spackl_shard ORDER BY "id" DESC, "name" DESC')
+    assert shard_query(query, order_by='id', limit=5) == (
+        'SELECT * FROM (select * from events) AS _spackl_shard ORDER BY "id" LIMIT 5')
+
+
+def test_merge_results():
+    shards = [make_result([(1, 'a'), (4, 'd'), (None, 'n')]),
+              make_result([(2, 'b'), (3, 'c'), (5, 'e')]),
+              QueryResult()]
+
+    merged = merge_results(shards, order_by='id')
+    assert isinstance(merged, QueryResult)
+    assert merged.list() == [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'), (5, 'e'), (None, 'n')]
+
+    merged = merge_results(shards, order_by='id', limit=2, storage='columns')
+    assert merged.storage == 'columns'
+    assert merged.list() == [(1, 'a'), (2, 'b')]
+
+    assert merge_results(shards, limit=4).list() == [(1, 'a'), (4, 'd'), (None, 'n'), (2, 'b')]
+
+    shards = [make_result([(None, 'n'), (4, 'd'), (1, 'a')]),
+              make_result([(5, 'e'), (3, 'c'), (3, 'b')])]
+    merged = merge_results(shards, order_by=['id'], descending=True)
+    assert merged.list() == [(None, 'n'), (5, 'e'), (4, 'd'), (3, 'c'), (3, 'b'), (1, 'a')]
+
+    assert merge_results([QueryResult()]).empty
+    with pytest.raises(ValueError):
+        merge_results([make_result([(1, 'a')]), make_result([(1, 'a')], keys=('id', 'other'))])
@@ -79,6 +79,32 @@ def test_file():
     assert csv.opened is False
 
 
+def test_file_columns():
+    csv = CSV(test_csv_path)
+
+    results = csv.query(storage='columns')
+    assert results.storage == 'columns'
+    assert results['first']._col == ('a', 'd', 'g')
+    assert results.result == expected_results
+
+
+def test_file_tuples():
+    csv = CSV(test_csv_path)
+
+    results = csv.query(storage='tuples')
+    assert results.storage == 'tuples'
+    assert results._result[0] == ('a', 'b', 'c')
+    assert results[1].second == 'e'
+    assert results.result == expected_results
+
+    results = CSV(test_csv_path).query(storage='tuples', fieldnames=['x', 'y', 'z', 'w'], restval='-')
+    assert list(results.keys()) == ['x', 'y', 'z', 'w']
+    assert results[0].values() == ('first', 'second', 'third', '-')
+
+    with pytest.raises(AttributeError):
+        CSV(test_csv_path).query(storage='tuples', fieldnames=['x', 'y'])
+
+
 def test_tab_file():
     csv = CSV(test_csv_tab_path)
 
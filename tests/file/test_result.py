@@ -54,3 +54,14 @@ def test_fileresult():
     expected_keys = ['a', 'b', 'c']
     for i, k in enumerate(fr.keys()):
         assert k == expected_keys[i]
+
+
+def test_fileresult_columns():
+    fr = FileResult(results, storage='columns')
+
+    assert fr.storage == 'columns'
+    assert len(fr) == 3
+    assert fr.c == ResultCol(
+        'c', (datetime.date(2018, 8, 1), datetime.date(2018, 9, 1), datetime.datetime(2018, 10, 1)))
+    assert fr == FileResult(results)
+    assert isinstance(fr[:1], FileResult)
@@ -0,0 +1,140 @@
+import mock
+import os
+import pytest
+import threading
+
+from collections import OrderedDict
+
+from spackl.cache import ResultCache, make_key, normalize_query
+from spackl.file import CSV, FileResult
+from spackl.result import BaseResult
+
+
+def make_result(n, storage='rows'):
+    return FileResult([OrderedDict([('id', str(i).zfill(4))]) for i in range(n)], storage=storage)
+
+
+def test_normalize_query():
+    assert normalize_query(' select *\n  from  t ;') == 'select * from t'
+    assert normalize_query("select 'a  b'  from t") == "select 'a  b' from t"
+    assert normalize_query('select "my  col", \'it\'\'s  \' from t') == 'select "my  col", \'it\'\'s  \' from t'
+    assert normalize_query('select 1 -- x\nfrom t') == 'select 1 from t'
+    assert normalize_query('select 1 -- x\nfrom t') != normalize_query('select 1 -- x from t')
+    assert normalize_query('select /* a\n b */ 1;  -- done') == 'select 1'
+    quoted = "select '-- not a comment', '/* nor this */'"
+    assert normalize_query(quoted) == quoted
+    assert make_key('a', 1) == make_key('a', 1)
+    assert make_key('a', 1) != make_key('a', 2)
+
+
+def test_get_put():
+    cache = ResultCache()
+    assert cache.get('key') is None
+
+    result = make_result(3, storage='columns')
+    cache.put('key', result)
+    hit = cache.get('key')
+    assert hit == result
+    assert isinstance(hit, FileResult)
+    assert hit.storage == 'columns'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Hits are copies, changing one doesn't change the cache
+    hit.pop()
+    assert len(cache.get('key')) == 3
+
+    cache.invalidate('key')
+    assert cache.get('key') is None
+    assert len(cache) == 0
+
+
+def test_counters_across_threads():
+    cache = ResultCache()
+    cache.put('hit', make_result(1))
+
+    def lookups():
+        for i in range(200):
+            cache.get('hit' if i % 2 else 'miss')
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.hits, cache.misses) == (800, 800)
+
+
+def test_lru_eviction():
+    # Each result is about 40 bytes
+    cache = ResultCache(max_bytes=100)
+    cache.put('a', make_result(10))
+    cache.put('b', make_result(10))
+    cache.get('a')
+    cache.put('c', make_result(10))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.evictions == 1
+    assert cache.bytes == 80
+
+    cache.put('big', make_result(100))
+    assert cache.get('big') is None
+    assert len(cache) == 2
+
+
+def test_ttl():
+    cache = ResultCache(ttl=10)
+    with mock.patch('spackl.cache.time.time', return_value=1000):
+        cache.put('a', make_result(1))
+        cache.put('b', make_result(1), ttl=100)
+    with mock.patch('spackl.cache.time.time', return_value=1050):
+        assert cache.get('a') is None
+        assert cache.get('b') is not None
+    assert len(cache) == 1
+
+
+def test_disk_tier(tmp_path):
+    path = str(tmp_path / 'cache')
+    cache = ResultCache(path=path, ttl=60)
+    result = BaseResult(['a', 'b'], [OrderedDict([('a', 1), ('b', None)])])
+    cache.put('key', result)
+    assert len(os.listdir(path)) == 1
+
+    # A new cache on the same path picks the entry back up, as after a restart
+    restarted = ResultCache(path=path)
+    assert restarted.get('key') == result
+    assert len(restarted) == 1
+
+    with mock.patch('spackl.cache.time.time', return_value=2 ** 40):
+        assert ResultCache(path=path).get('key') is None
+    assert os.listdir(path) == []
+
+    cache.put('key', result)
+    with open(os.path.join(path, 'broken.pickle'), 'wb') as f:
+        f.write(b'not a pickle')
+    assert ResultCache(path=path).get('broken') is None
+    cache.clear()
+    assert os.listdir(path) == []
+    assert len(cache) == 0
+
+
+def test_csv_cache(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text(u'first,second\na,b\n')
+    cache = ResultCache()
+    csv = CSV(str(path), cache=cache)
+    assert csv.cache is cache
+
+    result = csv.query()
+    with mock.patch.object(csv, 'open', side_effect=AssertionError('should be cached')):
+        assert csv.query() == result
+    assert csv.query(storage='tuples').storage == 'tuples'
+    assert cache.hits == 1
+
+    # Changing the file changes its size, so the old result isn't used
+    path.write_text(u'first,second\na,b\nc,d\n')
+    assert len(csv.query()) == 2
+
+    with pytest.raises(TypeError):
+        csv.cache = dict()
@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+from spackl import metrics
+from spackl.file import CSV
+from spackl.result import BaseResult
+from spackl.util import Path
+
+test_csv_path = Path.cwd().as_posix() + '/tests/file/data/test.csv'
+query = 'select * from nowhere'
+
+
+def test_approximate_bytes():
+    result = BaseResult(['a', 'b'], [OrderedDict([('a', 'xy'), ('b', None)]),
+                                     OrderedDict([('a', 'z'), ('b', 10)])])
+    assert metrics.approximate_bytes(result) == 5
+    assert metrics.approximate_bytes(BaseResult([], [])) == 0
+
+    result = BaseResult(['a'], [('abcd',)] * 1000, storage='columns')
+    assert metrics.approximate_bytes(result, sample_size=10) == 4000
+
+
+def test_no_listeners():
+    csv = CSV(test_csv_path)
+    assert csv._instrument('query') is metrics.NO_TIMING
+
+
+def test_global_listener():
+    events = list()
+
+    def broken(event):
+        raise ValueError('oops')
+
+    metrics.add_listener(broken)
+    metrics.add_listener(events.append)
+    try:
+        result = CSV(test_csv_path).query()
+    finally:
+        metrics.remove_listener(broken)
+        metrics.remove_listener(events.append)
+
+    assert len(result) == 3
+    event, = events
+    assert event.source == 'CSV'
+    assert event.query is None
+    assert list(event.phases) == ['open', 'sniff', 'read']
+    assert event.rows == 3
+
+    CSV(test_csv_path).query()
+    assert len(events) == 1
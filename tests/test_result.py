@@ -10,7 +10,8 @@ from collections import OrderedDict
 from spackl.result import (
     BaseResult,
     ResultCol,
-    ResultRow)
+    ResultRow,
+    ResultSchema)
 from spackl.util import DtDecEncoder
 
 
@@ -226,3 +227,174 @@ def test_resultcol_rquery_format():
 
     rc5 = ResultCol('a', (None, 'one', None))
     assert rc5._rquery_format() == "('one')"
+
+
+def test_baseresult_columns():
+    with pytest.raises(ValueError):
+        BaseResult(*generate_result(), storage='sideways')
+
+    br = BaseResult(*generate_result())
+    cr = BaseResult(*generate_result(), storage='columns')
+
+    assert cr.storage == 'columns'
+    assert cr._result is None
+    assert cr._columns[0] == (1, 4, 7)
+    assert cr == br
+    assert br == cr
+    assert bool(cr) is True
+    assert len(cr) == 3
+
+    assert cr.a is not None
+    assert cr['a'] == ResultCol('a', (1, 4, 7))
+    assert cr['a']._col is cr._columns[0]
+    assert cr[1] == br[1]
+    assert cr[-1].c == datetime.datetime(2018, 10, 1)
+    assert cr[1:] == br[1:]
+    assert cr[::2].storage == 'columns'
+    assert [row.a for row in cr] == [1, 4, 7]
+    with pytest.raises(IndexError):
+        cr[3]
+
+    assert cr.list() == br.list()
+    assert cr.dict() == br.dict()
+    assert cr.json() == br.json()
+    assert cr.result == expected_result
+    assert cr.df().equals(br.df())
+    assert cr.first() == br.first()
+
+    empty = BaseResult(list(), list(), storage='columns')
+    assert bool(empty) is False
+    assert empty.empty is True
+    assert empty.list() == list()
+    with pytest.raises(IndexError):
+        empty[0]
+
+
+def test_baseresult_columns_manipulation():
+    cr = BaseResult(*generate_result(), storage='columns')
+    br2 = BaseResult(*generate_other_result())
+
+    cr.append(cr[0])
+    assert len(cr) == 4
+    assert cr[-1] == cr[0]
+    with pytest.raises(ValueError):
+        cr.append(br2[0])
+
+    cr.extend(BaseResult(*generate_result()))
+    assert len(cr) == 7
+    assert cr.a == ResultCol('a', (1, 4, 7, 1, 1, 4, 7))
+    with pytest.raises(ValueError):
+        cr.extend(br2)
+
+    r = cr.pop()
+    assert r.a == 7
+    r = cr.pop(1)
+    assert r.a == 4
+    assert cr.a == ResultCol('a', (1, 7, 1, 1, 4))
+    with pytest.raises(IndexError):
+        cr.pop(5)
+
+    filtered = cr.filter(lambda row: row.a > 1)
+    assert filtered.storage == 'columns'
+    assert filtered.a == ResultCol('a', (7, 4))
+    cr.filter(lambda row: row.a == 1, inplace=True)
+    assert len(cr) == 3
+
+    empty = BaseResult(list(), list(), storage='columns')
+    empty.extend(br2)
+    assert empty._keys == expected_other_keys
+    assert empty.b == ResultCol('b', (2, 4))
+
+    empty = BaseResult(list(), list(), storage='columns')
+    empty.append(br2[1])
+    assert empty.list() == [(3, 4)]
+
+
+def test_resultschema():
+    schema = ResultSchema(['a', 'b', 'c', 'a'])
+
+    assert len(schema) == 4
+    assert list(schema) == ['a', 'b', 'c', 'a']
+    assert schema == ['a', 'b', 'c', 'a']
+    assert ['a', 'b', 'c', 'a'] == schema
+    assert schema == ResultSchema(['a', 'b', 'c', 'a'])
+    assert schema != ResultSchema(['a'])
+    assert not schema == 3
+    assert schema[1] == 'b'
+    assert 'c' in schema
+    assert 'd' not in schema
+    assert {} not in schema
+    assert schema.index('a') == 0
+    assert schema.index('c') == 2
+    with pytest.raises(ValueError):
+        schema.index('d')
+    assert repr(schema) == "['a', 'b', 'c', 'a']"
+
+
+def test_baseresult_tuples():
+    br = BaseResult(*generate_result())
+    tr = BaseResult(*generate_result(), storage='tuples')
+
+    assert tr.storage == 'tuples'
+    assert isinstance(tr._keys, ResultSchema)
+    assert tr._result[0] == (1, decimal.Decimal(2.0), datetime.date(2018, 8, 1))
+    assert tr == br
+    assert br == tr
+    assert len(tr) == 3
+
+    assert tr.b == br.b
+    assert tr[1] == br[1]
+    assert tr[0]._keys is tr[1]._keys is tr._keys
+    assert tr[1:] == br[1:]
+    assert tr.list() == br.list()
+    assert tr.dict() == br.dict()
+    assert tr.json() == br.json()
+    assert tr.result == expected_result
+    assert tr.df().equals(br.df())
+
+    tr.append(br[0])
+    br.append(tr[0])
+    assert tr._result[-1] == tr._result[0]
+    assert isinstance(br._result[-1], OrderedDict)
+    assert br == tr
+
+    tr.extend(br)
+    assert len(tr) == 8
+    assert tr.pop(0).a == 1
+    assert len(tr.filter(lambda row: row.a == 4)) == 2
+
+
+def test_resultrow_tuples():
+    tr = BaseResult(*generate_result(), storage='tuples')
+    rr = tr[0]
+
+    assert bool(rr) is True
+    assert rr[0] == rr.a == rr['a'] == 1
+    assert rr[-1] == rr.c == rr['c'] == datetime.date(2018, 8, 1)
+    with pytest.raises(TypeError):
+        rr[OrderedDict]
+    with pytest.raises(KeyError):
+        rr['d']
+
+    assert rr == BaseResult(*generate_result())[0]
+    assert rr != tr[1]
+    assert rr.keys() == expected_keys
+    assert rr.values() == (1, decimal.Decimal('2'), datetime.date(2018, 8, 1))
+    assert str(rr) == "(1, Decimal('2'), datetime.date(2018, 8, 1))"
+    assert dict(rr.items()) == {'a': 1, 'b': decimal.Decimal(2.0), 'c': datetime.date(2018, 8, 1)}
+
+    assert rr.get('a') == 1
+    assert rr.get(1) is None
+    assert rr.get('d', 5) == 5
+
+
+def test_baseresult_iter_batches():
+    br = BaseResult(*generate_result(), storage='columns')
+
+    batches = list(br.iter_batches(2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert batches[1].a == ResultCol('a', (7, ))
+    assert batches[0].storage == 'columns'
+
+    with pytest.raises(ValueError):
+        list(br.iter_batches(0))